@@ -0,0 +1,165 @@
+# !/usr/bin/python3
+"""
+ActuatorScheduler - drive the boat's actuators at a fixed rate
+Rather than writing to the motors and rudder as each control
+event arrives, events post targets and a single thread moves the
+actuators towards them at a steady rate, limiting how fast each
+one may change (slew) and how fast that may change (acceleration).
+"""
+
+import math
+import time
+from threading import Lock, Thread
+
+from TestCode.BoatOutputs import setValue
+
+
+def perActuator(limit, count):
+    # a limit for each actuator from a single value or a sequence (None is no limit)
+    if limit is None or isinstance(limit, (int, float)):
+        return [limit] * count
+    limits = list(limit)
+    if len(limits) != count:
+        raise ValueError('need one limit per actuator')
+    return limits
+
+
+class ActuatorScheduler(Thread):
+    '''
+    Moves actuators towards their posted targets rate times a second.
+
+    actuators are gpiozero devices with a value (motors and servos).
+    slew is the most each may change per second (full range is 2.0)
+    and acceleration the most its rate of change may change per second,
+    either may be one value for all, one per actuator, or None for no limit.
+    write(device, value) is used for the writes, so it can be coalesced,
+    and flush() (if given) after each tick's writes, so they can be banked.
+
+    A tick and reset() are never run at once, so once reset() returns
+    no tick can write a position from before it.
+    Ticks are due at fixed times from the start on the monotonic clock.
+    jitter is how late a tick ran, overruns counts ticks missed
+    because the last one was more than a whole tick late.
+    '''
+
+    def __init__(self, actuators, rate=100.0, slew=None, acceleration=None, write=None, flush=None):
+        Thread.__init__(self, daemon=True)
+        self.actuators = tuple(actuators)
+        count = len(self.actuators)
+        self.rate = rate
+        self.slew = perActuator(slew, count)
+        self.acceleration = perActuator(acceleration, count)
+        self.write = write or setValue
+        self.flush = flush
+        self.targets = tuple(device.value or 0.0 for device in self.actuators)
+        self._positions = list(self.targets)
+        self._speeds = [0.0] * count
+        self._lock = Lock()  # one of step() or reset() at a time
+        self.ticks = 0
+        self.overruns = 0
+        self.worstJitter = 0.0
+        self._totalJitter = 0.0
+        self.ok = False
+        return
+
+    def post(self, *targets):
+        # newest targets win, replacing the tuple is atomic
+        self.targets = targets
+        return
+
+    def reset(self, values):
+        # jump straight to values (as for an emergency stop),
+        # waiting for any tick in progress to finish first
+        with self._lock:
+            self.targets = tuple(values)
+            self._positions = list(values)
+            self._speeds = [0.0] * len(self._speeds)
+        return
+
+    def reverse(self, indices):
+        # negate the actuators at indices where they are and where they
+        # are heading, writing them now, as one tick would
+        with self._lock:
+            targets = list(self.targets)
+            positions = self._positions
+            speeds = self._speeds
+            for i in indices:
+                targets[i] = -targets[i]
+                positions[i] = -positions[i]
+                speeds[i] = -speeds[i]
+                self.write(self.actuators[i], positions[i])
+            self.targets = tuple(targets)
+            if self.flush:
+                self.flush()
+        return
+
+    def meanJitter(self):
+        if not self.ticks:
+            return 0.0
+        return self._totalJitter / self.ticks
+
+    def stats(self):
+        return {"ticks": self.ticks, "overruns": self.overruns,
+                "meanJitter": self.meanJitter(), "worstJitter": self.worstJitter}
+
+    def shutdown(self):
+        self.ok = False
+        return
+
+    def run(self):
+        self.ok = True
+        interval = 1.0 / self.rate
+        start = time.monotonic()
+        tick = 0
+        while self.ok:
+            tick += 1
+            due = start + tick * interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            late = time.monotonic() - due
+            if late > interval:  # skip what can no longer be on time
+                missed = int(late / interval)
+                self.overruns += missed
+                tick += missed
+            if late > self.worstJitter:
+                self.worstJitter = late
+            self._totalJitter += late
+            self.ticks += 1
+            self.step(interval)
+        return
+
+    def step(self, dt):
+        # move each actuator one tick towards its target
+        with self._lock:
+            targets = self.targets
+            positions = self._positions
+            speeds = self._speeds
+            write = self.write
+            for i, device in enumerate(self.actuators):
+                target = targets[i]
+                position = positions[i]
+                if position == target and speeds[i] == 0.0:
+                    continue
+                distance = target - position
+                speed = distance / dt  # to get there this tick
+                slew = self.slew[i]
+                accel = self.acceleration[i]
+                if accel is not None:
+                    # no faster than can be stopped in the distance left
+                    brake = math.sqrt(2.0 * accel * abs(distance))
+                    speed = max(-brake, min(brake, speed))
+                    speed = max(speeds[i] - accel * dt, min(speeds[i] + accel * dt, speed))
+                if slew is not None:
+                    speed = max(-slew, min(slew, speed))
+                position += speed * dt
+                if (distance > 0 and position >= target) or (distance < 0 and position <= target) \
+                        or distance == 0:
+                    position = target
+                    speed = 0.0
+                positions[i] = position
+                speeds[i] = speed
+                write(device, position)
+            if self.flush:
+                self.flush()
+        return
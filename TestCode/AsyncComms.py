@@ -0,0 +1,315 @@
+# !/usr/bin/python3
+"""
+AsyncComms - CommsServer and CommsListener on one asyncio event loop
+The threaded CommsServer and CommsListener give every server and
+every connection its own thread, mostly just blocked waiting.
+These do the same job as tasks on a single event loop (in a single
+thread), calling the controller in just the same way.
+Receivers that can only block (accept() and getMessage()) are
+bridged in through a worker thread of their own, as they block for
+the life of the server or connection and would soon use up a shared
+pool, and callback driven ones (BlueDot, the RC readers) hand their calls
+over to the loop, so the controller is only ever called from there.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event
+
+from TestCode.CommsController import (CommsReceiver, CommsListener, MessageReceiver,
+                                      ACCEPTED, SERVER_STOPPED, MESSAGE, LISTENER_STOPPED)
+from TestCode.Trace import trace
+
+
+class CommsLoop():
+    '''
+    The event loop shared by all the async comms, run in its own
+    thread (the rest of the boat is not async) once first needed.
+
+    workers is the most short blocking calls run at once on the
+    shared pool; receivers that block for as long as they are open
+    get a worker() each instead.
+    '''
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.loop = None
+        self.executor = None
+        self._thread = None
+        return
+
+    def start(self):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="comms")
+            self.loop.set_default_executor(self.executor)
+            started = Event()
+            self._thread = Thread(target=self._run, args=(started,), daemon=True)
+            self._thread.start()
+            started.wait()
+        return self.loop
+
+    def _run(self, started):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(started.set)
+        self.loop.run_forever()
+        return
+
+    def submit(self, coroutine):
+        # run a coroutine on the loop, from any thread
+        return asyncio.run_coroutine_threadsafe(coroutine, self.start())
+
+    def call(self, function, *args):
+        # call function on the loop, from any thread
+        self.start().call_soon_threadsafe(function, *args)
+        return
+
+    def blocking(self, function, *args, worker=None):
+        # await function(*args) run on worker, or the shared pool
+        return self.loop.run_in_executor(worker or self.executor, function, *args)
+
+    def worker(self, name):
+        # a thread of its own, for a receiver that blocks while it is open
+        # (shut it down when done with it)
+        return ThreadPoolExecutor(1, thread_name_prefix=name)
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.executor.shutdown(wait=False)
+            self.loop.close()
+            self.loop = None
+        return
+
+
+# the loop shared by everything
+commsLoop = CommsLoop()
+
+
+class AsyncCommsServer():
+    '''
+    A CommsServer whose accept loop is a task on the shared loop.
+
+    The controller sees just the same calls (startup(), connected()
+    and so on) as from a :class:`CommsServer`.
+    Children should override makeReceiver() and makeListener() as for
+    CommsServer, and may override accept() with a native coroutine,
+    otherwise the receiver's blocking accept() is bridged, on a worker
+    thread of the server's own (and its close() must then make
+    accept() return, to free the worker).
+    '''
+
+    def __init__(self, setup=None, loop=None):
+        self.setup = setup
+        self.loop = loop or commsLoop
+        self.receiver = self.makeReceiver()  # for receiving connections
+        self.serverId = None
+        self.controller = None
+        self.ok = False
+        self._task = None
+        self._worker = None  # thread for a blocking accept()
+        return
+
+    def startup(self, serverId, controller):
+        self.serverId, self.controller = serverId, controller
+        self.ok = self.receiver is not None
+        if self.ok:
+            self._task = self.loop.submit(self.serve())
+        return self.ok
+
+    def shutdown(self):
+        self.ok = False
+        if self.receiver:
+            self.receiver.close()
+            self.receiver = None
+        if self._task:
+            self._task.cancel()
+        return
+
+    async def serve(self):
+        loop = 0
+        while self.ok:
+            try:
+                loop += 1
+                connection = await self.accept()
+                if not self.ok:
+                    break  # shut down while waiting
+                if trace.on:
+                    trace.record(ACCEPTED, self.serverId, loop)
+                listener = self.makeListener(connection)
+                self.controller.connected(listener)
+                # some receivers need to be recreated after a connection
+                if not self.receiver and self.ok:
+                    self.receiver = self.makeReceiver()
+            except asyncio.CancelledError:
+                self.ok = False
+            except Exception as e:
+                print(f"AsyncCommsServer.serve({loop}) connection exception:", e)
+                self.ok = False
+        if self._worker:
+            self._worker.shutdown(wait=False)
+            self._worker = None
+        if trace.on:
+            trace.record(SERVER_STOPPED, self.serverId, loop)
+        self.controller.stopping(self.serverId)
+        return
+
+    async def accept(self):
+        if self._worker is None:
+            self._worker = self.loop.worker("comms-accept")
+        return await self.loop.blocking(self.receiver.accept, worker=self._worker)
+
+    def makeReceiver(self):
+        return CommsReceiver(self.setup)
+
+    def makeListener(self, connection):
+        listener = None
+        if connection:
+            listener = AsyncCommsListener(connection, controller=self.controller, loop=self.loop)
+        return listener
+
+
+class AsyncCommsListener():
+    '''
+    A CommsListener whose message loop is a task on the shared loop.
+
+    Children should override makeReceiver() and execute() as for
+    CommsListener, and may override getMessage() with a native
+    coroutine, otherwise the receiver's blocking getMessage() is bridged,
+    on a worker thread of the listener's own.
+    Listeners driven by callbacks from other threads should pass
+    them to the controller through dispatch().
+    '''
+
+    def __init__(self, connection, controller=None, loop=None):
+        self.loop = loop or commsLoop
+        self.receiver = None
+        if connection:
+            self.receiver = self.makeReceiver(connection)
+        self.controller = controller
+        self.connectionId = None
+        self.ok = False
+        self._task = None
+        self._closed = None
+        self._worker = None  # thread for a blocking getMessage()
+        return
+
+    def startup(self, connectionId, controller):
+        # also called again to change the connection id (see CommsController.double())
+        self.connectionId = connectionId
+        self.controller = controller
+        self.ok = self.receiver is not None
+        if self.ok and not self._task:
+            self._task = self.loop.submit(self.listen())
+        return self.ok
+
+    def shutdown(self):
+        self.finish()
+        if self.receiver:
+            self.receiver.close()
+            self.receiver = None
+        return
+
+    def finish(self):
+        # end listen(), say when the far end has gone
+        self.ok = False
+        if self._closed:
+            self.loop.call(self._close)
+        return
+
+    def _close(self):
+        if not self._closed.done():
+            self._closed.set_result(None)
+        return
+
+    async def closing(self):
+        """
+        Wait until shutdown() or finish(), for listeners driven by callbacks.
+        """
+        self._closed = self.loop.loop.create_future()
+        if self.ok:
+            await self._closed
+        return None
+
+    def is_alive(self):
+        return self._task is not None and not self._task.done()
+
+    async def listen(self):
+        try:
+            while self.ok:
+                message = await self.getMessage()
+                if trace.on:
+                    trace.record(MESSAGE, self.connectionId)
+                if message:
+                    self.execute(message)
+                else:
+                    self.ok = False
+        except asyncio.CancelledError:
+            self.ok = False
+        except Exception as e:
+            print("AsyncCommsListener exception:", e)
+            self.ok = False
+        if self._worker:
+            self._worker.shutdown(wait=False)
+            self._worker = None
+        if trace.on:
+            trace.record(LISTENER_STOPPED, self.connectionId)
+        if self.controller:
+            self.controller.disconnected(self.connectionId)
+        return
+
+    def dispatch(self, method, *args):
+        # run a controller call on the loop, from any thread
+        self.loop.call(method, *args)
+        return
+
+    async def getMessage(self):
+        if self._worker is None:
+            self._worker = self.loop.worker("comms-listener")
+        return await self.loop.blocking(self.receiver.getMessage, worker=self._worker)
+
+    def makeReceiver(self, connection):
+        return MessageReceiver(setup=connection)
+
+    execute = CommsListener.execute
+    perform = CommsListener.perform
+
+
+if __name__ == '__main__':
+    # for testing, lots of idle connections cost no threads
+    import threading
+    from queue import Queue
+    from TestCode.CommsController import CommsController
+
+    class QueueReceiver(CommsReceiver):
+        def setup(self, setup):
+            self.queue = setup
+            return
+
+        def accept(self):
+            return self.queue.get()
+
+        def close(self):
+            self.queue.put(None)
+            return
+
+    class EventListener(AsyncCommsListener):
+        async def getMessage(self):
+            return await self.closing()
+
+    class EventServer(AsyncCommsServer):
+        def makeReceiver(self):
+            return QueueReceiver(self.setup)
+
+        def makeListener(self, connection):
+            return EventListener(connection, controller=self.controller, loop=self.loop)
+
+    connections = Queue()
+    controller = CommsController(server=EventServer(connections))
+    for i in range(20):
+        connections.put(object())
+    while len(controller.listeners) < 20:
+        threading.Event().wait(0.01)
+    print("connections:", len(controller.listeners), "threads:", threading.active_count())
+    controller.shutdown()
@@ -9,6 +9,7 @@ import sys
 from bluedot import BlueDot
 
 from TestCode.CommsController import CommsServer, CommsListener, CommsReceiver, MessageReceiver, CommsController
+from TestCode.AsyncComms import AsyncCommsServer, AsyncCommsListener
 
 
 # no class BdController()
@@ -80,20 +81,14 @@ class BdReceiver(CommsReceiver):
         return
 
 
-class BdListener(CommsListener):
+class BdPad():
     '''
-    Listener is a threaded device to listen for messages.
-
-    Listener is started with a receiver
-    (BlueDot object that has been connected)
-    and a defined server object.
+    Shows a connection's role on its BlueDot and turns the BlueDot's
+    callbacks into controller calls (through dispatch()), shared by
+    the threaded and the async listeners.
     '''
 
-    def makeReceiver(self, connection):
-        # turn a connection (a BlueDot) into the receiver
-        return BdMessageReceiver(setup=connection)
-
-    def startup(self, connectionId, controller):
+    def attach(self, connectionId):
         # ## print("BdListener.startup(): connectionId=", connectionId, "controller=", controller)
         if connectionId == 0:
             # navigate - green square
@@ -112,7 +107,44 @@ class BdListener(CommsListener):
         self.receiver.bd.when_pressed = self.press
         self.receiver.bd.when_released = self.lift
         self.receiver.bd.when_moved = self.move
-        # ## print("BdListener.startup(): starting super()")
+        return
+
+    def double(self, pos):
+        x, y = pos.x, pos.y
+        self.dispatch(self.controller.double, self.connectionId, x, y)
+        return
+
+    def press(self, pos):
+        x, y = pos.x, pos.y
+        self.dispatch(self.controller.press, self.connectionId, x, y)
+        return
+
+    def lift(self, pos):
+        x, y = pos.x, pos.y
+        self.dispatch(self.controller.lift, self.connectionId, x, y)
+        return
+
+    def move(self, pos):
+        x, y = pos.x, pos.y
+        self.dispatch(self.controller.move, self.connectionId, x, y)
+        return
+
+
+class BdListener(BdPad, CommsListener):
+    '''
+    Listener is a threaded device to listen for messages.
+
+    Listener is started with a receiver
+    (BlueDot object that has been connected)
+    and a defined server object.
+    '''
+
+    def makeReceiver(self, connection):
+        # turn a connection (a BlueDot) into the receiver
+        return BdMessageReceiver(setup=connection)
+
+    def startup(self, connectionId, controller):
+        self.attach(connectionId)
         super().startup(connectionId, controller)
         return
 
@@ -139,24 +171,55 @@ class BdListener(CommsListener):
         self.ok = False
         return
 
-    def double(self, pos):
-        x, y = pos.x, pos.y
-        self.controller.double(self.connectionId, x, y)
-        return
 
-    def press(self, pos):
-        x, y = pos.x, pos.y
-        self.controller.press(self.connectionId, x, y)
-        return
+class AsyncBdServer(AsyncCommsServer):
+    '''
+    A BdServer on the shared event loop, waiting for a connection
+    by the BlueDot's callback rather than a blocked thread.
+    '''
 
-    def lift(self, pos):
-        x, y = pos.x, pos.y
-        self.controller.lift(self.connectionId, x, y)
-        return
+    makeReceiver = BdServer.makeReceiver
 
-    def move(self, pos):
-        x, y = pos.x, pos.y
-        self.controller.move(self.connectionId, x, y)
+    async def accept(self):
+        bd = self.receiver.bd
+        connected = self.loop.loop.create_future()
+
+        def connects():
+            self.loop.call(lambda: connected.done() or connected.set_result(bd))
+
+        bd.when_client_connects = connects
+        if not bd.is_connected:
+            await connected
+        bd.when_client_connects = None
+        return bd
+
+    def makeListener(self, connection):
+        # a new BlueDot is needed for the next connection
+        listener = None
+        if connection:
+            listener = AsyncBdListener(connection, controller=self.controller, loop=self.loop)
+            self.receiver = None
+        return listener
+
+
+class AsyncBdListener(BdPad, AsyncCommsListener):
+    '''
+    Listener for a BlueDot on the shared event loop,
+    its callbacks are handed over to the loop.
+    '''
+
+    def makeReceiver(self, connection):
+        return BdMessageReceiver(setup=connection)
+
+    def startup(self, connectionId, controller):
+        self.attach(connectionId)
+        return super().startup(connectionId, controller)
+
+    async def getMessage(self):
+        return await self.closing()
+
+    def disconnect(self):
+        self.finish()
         return
 
 
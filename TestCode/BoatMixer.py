@@ -0,0 +1,140 @@
+# !/usr/bin/python3
+"""
+BoatMixer - mixing joystick (x, y) to motor and rudder settings
+The mixing is a plain function, which the boat uses by default,
+and a precomputed table of it, which can be used instead to save
+redoing the arithmetic on every move.
+"""
+
+from array import array
+
+
+def mix(x, y, thrustDelta=1.0, leftDelta=1.0, rightDelta=1.0, centerDelta=1.0, toServo=1.0):
+    """
+    Returns (left, right, center, rudder) for the joystick (x, y).
+
+    See GPIOZeroBoat.navigate() for the details.
+    """
+    left, right, center = y, y, y  # straight ahead
+    rudder = x
+    if x < 0:  # turn left
+        if y < 0:  # going backward
+            cap = 1.0 + y  # max amount we change by
+            delta = -min(-x * thrustDelta, cap)
+        else:  # going forwards
+            cap = 1.0 - y  # max amount we change by
+            delta = min(-x * thrustDelta, cap)
+        left -= delta
+        right += delta
+    else:  # turn right
+        if y < 0:  # going backward
+            cap = 1.0 + y  # max amount we change by
+            delta = -min(x * thrustDelta, cap)
+        else:  # going forwards
+            cap = 1.0 - y  # max amount we change by
+            delta = min(x * thrustDelta, cap)
+        left += delta
+        right -= delta
+    return left * leftDelta, right * rightDelta, center * centerDelta, rudder * toServo
+
+
+def mixAll(xs, ys, **ratios):
+    """
+    Mix whole sequences of stick positions.
+
+    Returns four arrays: left, right, center and rudder.
+    """
+    results = (array('d'), array('d'), array('d'), array('d'))
+    for x, y in zip(xs, ys):
+        for result, value in zip(results, mix(x, y, **ratios)):
+            result.append(value)
+    return results
+
+
+class MixingTable():
+    '''
+    A precomputed table of mix() over a grid of stick positions.
+
+    resolution is the number of points across each axis (from -1 to 1).
+    With interpolate, lookups are bilinear between the four nearest
+    points, otherwise the nearest point is used (quantised).
+    Steering swaps over between going forward and backward, so
+    there is a grid for each, both ending at y = 0 (from their own
+    side), so that nothing is interpolated across the swap.
+    Call build() with new ratios whenever they change.
+    '''
+
+    def __init__(self, resolution=41, interpolate=True, **ratios):
+        self.resolution = resolution
+        self.interpolate = interpolate
+        self.build(**ratios)
+        return
+
+    def build(self, **ratios):
+        half = max(self.resolution // 2, 1)  # cells from 0 to 1
+        n = 2 * half + 1  # points across
+        self.ratios = ratios
+        self._half = half
+        self._n = n
+        self.tables = (array('d'), array('d'), array('d'), array('d'))
+        backward = [-1.0 + j / half for j in range(half)] + [-1e-12]
+        forward = [j / half for j in range(half + 1)]
+        for y in backward + forward:
+            for i in range(n):
+                x = -1.0 + i / half
+                for table, value in zip(self.tables, mix(x, y, **ratios)):
+                    table.append(value)
+        return
+
+    def lookup(self, x, y):
+        """
+        Returns (left, right, center, rudder) for the joystick (x, y).
+        """
+        half = self._half
+        n = self._n
+        # stick to grid position, capped to the grid
+        gx = (min(max(x, -1.0), 1.0) + 1.0) * half
+        if y < 0:
+            gy = (max(y, -1.0) + 1.0) * half
+            base = 0
+        else:
+            gy = min(y, 1.0) * half
+            base = (half + 1) * n  # forward grid
+        left, right, center, rudder = self.tables
+        if not self.interpolate:
+            k = base + int(gy + 0.5) * n + int(gx + 0.5)
+            return left[k], right[k], center[k], rudder[k]
+        i = min(int(gx), n - 2)
+        j = min(int(gy), half - 1)
+        fx = gx - i
+        fy = gy - j
+        a = base + j * n + i  # the four corners
+        b = a + 1
+        c = a + n
+        d = c + 1
+        w00 = (1.0 - fx) * (1.0 - fy)
+        w10 = fx * (1.0 - fy)
+        w01 = (1.0 - fx) * fy
+        w11 = fx * fy
+        return (left[a] * w00 + left[b] * w10 + left[c] * w01 + left[d] * w11,
+                right[a] * w00 + right[b] * w10 + right[c] * w01 + right[d] * w11,
+                center[a] * w00 + center[b] * w10 + center[c] * w01 + center[d] * w11,
+                rudder[a] * w00 + rudder[b] * w10 + rudder[c] * w01 + rudder[d] * w11)
+
+    def mixAll(self, xs, ys):
+        """
+        Look up whole sequences of stick positions.
+
+        Returns four arrays: left, right, center and rudder.
+        """
+        results = (array('d'), array('d'), array('d'), array('d'))
+        lookup = self.lookup
+        for x, y in zip(xs, ys):
+            for result, value in zip(results, lookup(x, y)):
+                result.append(value)
+        return results
+
+
+if __name__ == '__main__':
+    # for testing
+    pass
@@ -0,0 +1,183 @@
+# !/usr/bin/python3
+"""
+BoatOutputs - ways of writing values to the boat's devices
+Each write to a gpiozero device usually ends up as a message to
+the pigpio daemon, so it is worth not sending ones that make no
+difference.
+"""
+
+
+def setValue(device, value):
+    # plain write, as used when not coalescing
+    device.value = value
+    return True
+
+
+class OutputCoalescer():
+    '''
+    Skips writes that would make no real change.
+
+    The last value written to each device is kept and a new value
+    within epsilon of it is not written (unless it is exactly stop
+    or full, and the last one was not).
+    issued and skipped count the writes made and saved.
+    '''
+
+    def __init__(self, epsilon=0.005):
+        self.epsilon = epsilon
+        self.issued = 0
+        self.skipped = 0
+        self._last = {}
+        return
+
+    def write(self, device, value):
+        # returns True if the value was written
+        last = self._last.get(device)
+        if last is not None and abs(value - last) <= self.epsilon:
+            if value == last or value not in (-1.0, 0.0, 1.0):
+                self.skipped += 1
+                return False
+        device.value = value
+        self._last[device] = value
+        self.issued += 1
+        return True
+
+    def forget(self, device=None):
+        # device (or all devices) changed behind our back, so write next time
+        if device is None:
+            self._last.clear()
+        else:
+            self._last.pop(device, None)
+        return
+
+    def stats(self):
+        total = self.issued + self.skipped
+        saved = 100.0 * self.skipped / total if total else 0.0
+        return {"issued": self.issued, "skipped": self.skipped, "saved": saved}
+
+
+def noFlush():
+    # nothing gathered to write
+    return
+
+
+class PiGPIOBank():
+    '''
+    Writes gathered pin changes with pigpio bank operations.
+
+    pigpio has no single set-and-clear, so clears go first
+    (break before make, both directions are never on together)
+    then sets, each one round trip, and only if needed.
+    '''
+
+    def __init__(self, pi):
+        self.pi = pi
+        self.operations = 0
+        return
+
+    def apply(self, set_bits, clear_bits):
+        if clear_bits:
+            self.pi.clear_bank_1(clear_bits)
+            self.operations += 1
+        if set_bits:
+            self.pi.set_bank_1(set_bits)
+            self.operations += 1
+        return
+
+
+class MockBank():
+    '''
+    Applies gathered pin changes to a gpiozero MockFactory's pins, for testing.
+    '''
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.operations = 0
+        return
+
+    def apply(self, set_bits, clear_bits):
+        for bits, state in ((clear_bits, False), (set_bits, True)):
+            if bits:
+                self.operations += 1
+                number = 0
+                while bits:
+                    if bits & 1:
+                        self.factory.pin(number).state = state
+                    bits >>= 1
+                    number += 1
+        return
+
+
+def makeBank(factory):
+    # the bank writer to suit a pin factory
+    from gpiozero.pins.mock import MockFactory
+    if isinstance(factory, MockFactory):
+        return MockBank(factory)
+    if hasattr(factory, "connection"):  # PiGPIOFactory
+        return PiGPIOBank(factory.connection)
+    raise ValueError(f"no bank writes for {factory}")
+
+
+class BankedOutput():
+    '''
+    Gathers the direction pins of digital motors into bank writes.
+
+    Motors whose forward and backward devices are digital (pwm=False)
+    are not written one pin at a time, instead write() notes the pins
+    wanted on and off, and flush() sends all the changes of one update
+    in as few bank operations as possible.
+    A motor is driven forward or backward once its value reaches
+    threshold, and stopped below that.
+    Everything else is passed on to write (which may be a coalescer).
+    '''
+
+    def __init__(self, bank, motors, threshold=0.5, write=None):
+        from gpiozero import DigitalOutputDevice
+        self.bank = bank
+        self.threshold = threshold
+        self.fallback = write or setValue
+        self._pins = {}  # motor -> (forward bit, backward bit)
+        for motor in motors:
+            forward = motor.forward_device
+            backward = motor.backward_device
+            if isinstance(forward, DigitalOutputDevice):
+                self._pins[motor] = (1 << forward.pin.number, 1 << backward.pin.number)
+        self._set = 0
+        self._clear = 0
+        self.forget()
+        return
+
+    def forget(self):
+        # re-read the pins, after they are changed by something else
+        state = 0
+        for motor, (forward, backward) in self._pins.items():
+            if motor.forward_device.value:
+                state |= forward
+            if motor.backward_device.value:
+                state |= backward
+        self._state = state
+        return
+
+    def write(self, device, value):
+        bits = self._pins.get(device)
+        if bits is None:
+            return self.fallback(device, value)
+        forward, backward = bits
+        want = 0
+        if value >= self.threshold:
+            want = forward
+        elif value <= -self.threshold:
+            want = backward
+        both = forward | backward
+        have = (self._state | self._set) & ~self._clear & both
+        self._set = (self._set & ~both) | (want & ~self._state)
+        self._clear = (self._clear & ~both) | (both & ~want & self._state)
+        return want != have
+
+    def flush(self):
+        if self._set or self._clear:
+            self.bank.apply(self._set, self._clear)
+            self._state = (self._state | self._set) & ~self._clear
+            self._set = 0
+            self._clear = 0
+        return
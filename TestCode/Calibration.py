@@ -0,0 +1,253 @@
+# !/usr/bin/python3
+"""
+Calibration - measuring the boat's actuators and trimming them
+Each actuator is swept through a range of settings while what it
+actually does is measured (for example its PWM read back through
+a loopback wire by one of the PWM readers), a correction curve is
+fitted to the results and kept, with the balancing ratios, in a
+small trim file loaded at startup.
+The boat then writes every value through its actuator's correction
+table, so asking for 0.5 gives what measures as 0.5.
+"""
+
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from TestCode.BoatOutputs import setValue
+
+MAGIC = b"TRIM"
+VERSION = 1
+HEADER = struct.Struct("<4sHHH")  # magic, version, ratios, tables
+TABLE = struct.Struct("<16sH")  # actuator name, table size
+RATIOS = ("thrustDelta", "leftDelta", "rightDelta", "centerDelta", "toServo")
+DEFAULT_PATH = "boat.trim"
+
+
+def motorMeasure(forward, backward=None):
+    """
+    Measure a motor by PWM readers on its forward and backward pins,
+    or on its enable pin alone (the direction then being as commanded).
+    """
+    def measure(commanded):
+        value = forward.duty_cycle() / 100.0
+        if backward is None:
+            return value if commanded >= 0 else -value
+        return value - backward.duty_cycle() / 100.0
+    return measure
+
+
+def servoMeasure(reader, servo):
+    """
+    Measure a servo by a PWM reader on its pin, as a value from -1 to 1.
+    """
+    mid = (servo.min_pulse_width + servo.max_pulse_width) * 1000000.0 / 2
+    half = (servo.max_pulse_width - servo.min_pulse_width) * 1000000.0 / 2
+
+    def measure(commanded):
+        return (reader.pulse_width() - mid) / half
+    return measure
+
+
+def fit(samples):
+    """
+    The correction curve for samples of (commanded, measured):
+    returns (measured, commanded) arrays, with measured never falling,
+    to interpolate the command that gives a wanted measurement.
+    """
+    samples = sorted(samples)
+    measured = array('d')
+    commanded = array('d')
+    highest = None
+    for c, m in samples:
+        if highest is not None and m < highest:
+            m = highest  # noise, it can't go backwards
+        highest = m
+        commanded.append(c)
+        measured.append(m)
+    return measured, commanded
+
+
+def invert(curve, value):
+    # the command giving value, from a fit() curve
+    measured, commanded = curve
+    lo = bisect_left(measured, value)
+    hi = bisect_right(measured, value)
+    if hi > lo:  # measured exactly, the middle of any flat (so 0 stays 0)
+        return (commanded[lo] + commanded[hi - 1]) / 2
+    if lo == 0:
+        return commanded[0]
+    if lo == len(measured):
+        return commanded[-1]
+    m0, m1 = measured[lo - 1], measured[lo]
+    c0, c1 = commanded[lo - 1], commanded[lo]
+    return c0 + (c1 - c0) * (value - m0) / (m1 - m0)
+
+
+class CorrectionTable():
+    '''
+    The command to write for each wanted value from -1 to 1,
+    at size evenly spaced values, interpolated between.
+    '''
+
+    def __init__(self, values):
+        self.values = values
+        self._half = (len(values) - 1) / 2.0
+        self._end = len(values) - 1
+        return
+
+    @classmethod
+    def fromCurve(cls, curve, size=201):
+        half = (size - 1) / 2.0
+        return cls(array('f', (invert(curve, i / half - 1.0) for i in range(size))))
+
+    def apply(self, value):
+        values = self.values
+        g = (value + 1.0) * self._half
+        if g <= 0.0:
+            return values[0]
+        if g >= self._end:
+            return values[-1]
+        i = int(g)
+        return values[i] + (values[i + 1] - values[i]) * (g - i)
+
+
+class TrimProfile():
+    '''
+    The balancing ratios and a CorrectionTable for each calibrated
+    actuator (by name, as the boat's value names them).
+
+    Saved as a short header, the ratios as doubles and each table as
+    its name, size and floats, so loading is a single read.
+    '''
+
+    def __init__(self, ratios=None, tables=None):
+        self.ratios = dict(ratios or {})
+        self.tables = dict(tables or {})
+        return
+
+    def save(self, path=DEFAULT_PATH):
+        data = [HEADER.pack(MAGIC, VERSION, len(RATIOS), len(self.tables)),
+                struct.pack("<%dd" % len(RATIOS), *(self.ratios.get(name, 1.0) for name in RATIOS))]
+        for name, table in self.tables.items():
+            values = array('f', table.values)
+            data.append(TABLE.pack(name.encode("utf-8"), len(values)))
+            data.append(values.tobytes())
+        with open(path, "wb") as fd:
+            fd.write(b"".join(data))
+        return
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        with open(path, "rb") as fd:
+            data = fd.read()
+        magic, version, count, tables = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} trim file")
+        offset = HEADER.size
+        ratios = struct.unpack_from("<%dd" % count, data, offset)
+        offset += 8 * count
+        profile = cls(dict(zip(RATIOS, ratios)))
+        for i in range(tables):
+            name, size = TABLE.unpack_from(data, offset)
+            offset += TABLE.size
+            values = array('f')
+            values.frombytes(data[offset:offset + 4 * size])
+            offset += 4 * size
+            profile.tables[name.rstrip(b"\0").decode("utf-8")] = CorrectionTable(values)
+        return profile
+
+
+class CorrectedOutput():
+    '''
+    Writes each value through its device's CorrectionTable,
+    then on to write (which may be banked or coalesced).
+    '''
+
+    def __init__(self, tables, write=None):
+        self._tables = tables  # device -> CorrectionTable
+        self.fallback = write or setValue
+        return
+
+    def write(self, device, value):
+        table = self._tables.get(device)
+        if table is not None:
+            value = table.apply(value)
+        return self.fallback(device, value)
+
+
+class Calibrator():
+    '''
+    Sweeps a boat's actuators and fits their corrections.
+
+    measures maps actuator names (left_motor, ..., rudder) to
+    measure(commanded) functions returning what was measured,
+    see motorMeasure() and servoMeasure().
+    Each actuator is set to points values from -1 to 1 in turn,
+    left settle seconds, then measured.  prompt is called with
+    instructions before each sweep (use input to wait for the
+    operator, say to lift the boat out of the water).
+    '''
+
+    def __init__(self, boat, measures, points=21, settle=0.5, prompt=print):
+        self.boat = boat
+        self.measures = measures
+        self.points = points
+        self.settle = settle
+        self.prompt = prompt
+        self.samples = {}
+        return
+
+    def sweep(self, name):
+        device = getattr(self.boat, name)
+        measure = self.measures[name]
+        samples = []
+        for i in range(self.points):
+            commanded = -1.0 + 2.0 * i / (self.points - 1)
+            device.value = commanded
+            time.sleep(self.settle)
+            samples.append((commanded, measure(commanded)))
+        device.value = 0
+        self.samples[name] = samples
+        return samples
+
+    def run(self, size=201):
+        """
+        Sweep every measured actuator, returns the TrimProfile.
+        """
+        profile = TrimProfile(self.boat.ratios())
+        for name in self.measures:
+            self.prompt(f"Calibrating {name}: {self.points} settings over "
+                        f"{self.points * self.settle:.0f} seconds")
+            profile.tables[name] = CorrectionTable.fromCurve(fit(self.sweep(name)), size)
+        return profile
+
+
+if __name__ == '__main__':
+    # for testing, with a pretend measurement of a motor with a deadband
+    from gpiozero import Device
+    from gpiozero.pins.mock import MockFactory, MockPWMPin
+    from TestCode.GpioZeroBoat import GPIOZeroBoat
+    Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+    boat = GPIOZeroBoat((20, 21), (7, 1), (23, 24), 13)
+
+    def sluggish(commanded):
+        return 0.0 if abs(commanded) < 0.2 else (commanded - 0.2 * (1 if commanded > 0 else -1)) / 0.8
+
+    profile = Calibrator(boat, {"left_motor": sluggish}, settle=0.0).run()
+    import os
+    import tempfile
+    fd, path = tempfile.mkstemp(suffix=".trim")
+    os.close(fd)
+    try:
+        profile.save(path)
+        start = time.perf_counter()
+        profile = TrimProfile.load(path)
+        print(f"loaded in {(time.perf_counter() - start) * 1e6:.0f}us")
+    finally:
+        os.remove(path)
+    boat.calibrationOn(profile)
+    for y in (0.0, 0.1, 0.5, 1.0, -0.5):
+        boat.navigate(0.0, y)
+        print(y, "->", round(boat.left_motor.value, 3), "measures", round(sluggish(boat.left_motor.value), 3))
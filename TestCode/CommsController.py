@@ -10,8 +10,24 @@ Message     - Specific to client, but interpreted as action (press, move, lift,
 """
 
 import math
+from array import array
 from threading import Thread, enumerate
 
+from TestCode.Trace import trace
+from TestCode.ControlMailbox import ControlMailbox
+from TestCode.ControlProtocol import ACTIONS, CLOSE, ERROR, decodeAll
+
+CONNECTED = trace.event("comms.connected", "connection")
+DISCONNECTED = trace.event("comms.disconnected", "connection")
+PRESS = trace.event("comms.press", "connection", "x", "y")
+MOVE = trace.event("comms.move", "connection", "x", "y")
+LIFT = trace.event("comms.lift", "connection", "x", "y")
+DOUBLE = trace.event("comms.double", "connection", "x", "y")
+ACCEPTED = trace.event("comms.accepted", "server", "loop")
+SERVER_STOPPED = trace.event("comms.server.stopped", "server", "loop")
+MESSAGE = trace.event("comms.message", "connection")
+LISTENER_STOPPED = trace.event("comms.listener.stopped", "connection")
+
 
 def dp2(number):
     return format(number, "03.2f")
@@ -30,7 +46,7 @@ def xy2ra(x, y):
     if r > 1.0:
         r = 1.0
     if r > 0.1:  # angle only relevant if a distance from the center!
-        ax, ay = abs(a), abs(y)
+        ax, ay = abs(x), abs(y)
         sx = sy = 1  # +ve
         if x < 0:
             sx = -1
@@ -41,7 +57,7 @@ def xy2ra(x, y):
         if ax > ay:
             f = y / x
             aTanXY = math.atan(f) / math.pi
-            aTanXY = ss * (1 - aTanXY)
+            aTanXY = ss / 2 - aTanXY  # as atan(x / y) = +-pi / 2 - atan(y / x)
         else:
             f = x / y
             aTanXY = math.atan(f) / math.pi
@@ -50,6 +66,26 @@ def xy2ra(x, y):
     return r, a
 
 
+def xy2raAll(xs, ys):
+    '''
+    xy2ra() for whole sequences of (x, y), returns arrays of r and a.
+
+    Uses atan2 directly, which gives the same angles with one call.
+    '''
+    rs = array('d')
+    angles = array('d')
+    sqrt = math.sqrt
+    atan2 = math.atan2
+    turn = 2 * math.pi
+    for x, y in zip(xs, ys):
+        r = sqrt(x * x + y * y)
+        if r > 1.0:
+            r = 1.0
+        rs.append(r)
+        angles.append(atan2(x, y) / turn % 1.0 if r > 0.1 else 0.0)
+    return rs, angles
+
+
 class CommsController():
     '''
     This is a server for controller links.
@@ -81,21 +117,49 @@ class CommsController():
         print("targeting=", targeting)
         '''
         self.servers = []
-        if server:
-            self.addServer(server)
         self.listeners = []
         # uncomment the following line to stop navigation connection ...
         # self.listeners.append(CommsListener(None)) # temp fix to get to targets
         self.targets = 0
+        self.mailbox = None  # optional ControlMailbox, see mailboxOn()
         self.addBoat(boat)
+        # servers last, as they may connect as soon as they start
+        if server:
+            self.addServer(server)
         return
 
     def addBoat(self, boat):
         self.boat = boat
         return
 
+    def mailboxOn(self, maxAge=0.25):
+        """
+        Pass press, move and lift on to navigate() through a
+        ControlMailbox, so only the newest position of each
+        connection is used, on the mailbox's own thread.
+        """
+        if not self.mailbox:
+            self.mailbox = ControlMailbox(self.navigate, maxAge=maxAge)
+            self.mailbox.start()
+        return
+
+    def mailboxOff(self):
+        if self.mailbox:
+            self.mailbox.shutdown()
+            self.mailbox = None
+        return
+
+    def steer(self, connectionId, x, y):
+        # navigate now, or through the mailbox
+        if self.mailbox:
+            self.mailbox.post(connectionId, x, y)
+        else:
+            self.navigate(connectionId, x, y)
+        return
+
     def shutdown(self):
         # try and close neatly ...
+        self.mailboxOff()
         for server in self.servers:
             server.shutdown()
         self.servers = []
@@ -134,7 +198,8 @@ class CommsController():
         else:
             connectionId = len(self.listeners)
             self.listeners.append(listener)
-        # ## print("connected, connectionId=", connectionId)
+        if trace.on:
+            trace.record(CONNECTED, connectionId)
         # inform server that connection accpted
         listener.startup(connectionId, self)
         if connectionId > 0:  # targetting
@@ -152,7 +217,10 @@ class CommsController():
         # listener calls here when connection is broken to release it
         # calls back to shut down the listener
         # also lets the boat know
-        # ## print("disconnected", connectionId)
+        if trace.on:
+            trace.record(DISCONNECTED, connectionId)
+        if connectionId >= len(self.listeners):
+            return  # already shut down
         listener = self.listeners[connectionId]
         if listener:
             self.listeners[connectionId] = None  # remove it
@@ -163,36 +231,45 @@ class CommsController():
 
     def press(self, connectionId, x, y):
         # called by a listener that recieves a press at a position
-        # ## print("press", connectionId, (dp2(x), dp2(y)))
-        self.navigate(connectionId, x, y)
+        if trace.on:
+            trace.record(PRESS, connectionId, x, y)
+        self.steer(connectionId, x, y)
         return
 
     def move(self, connectionId, x, y):
         # called by a listener that recieves a move to a position
-        # ## print("move", connectionId, (dp2(x), dp2(y)))
-        self.navigate(connectionId, x, y)
+        if trace.on:
+            trace.record(MOVE, connectionId, x, y)
+        self.steer(connectionId, x, y)
         return
 
     def lift(self, connectionId, x, y):
         # called by a listener that recieves a lift from a position
-        # ## print("lift", connectionId, (dp2(x), dp2(y)))
+        if trace.on:
+            trace.record(LIFT, connectionId, x, y)
         if connectionId == 0:  # navigate - stop when lift
-            self.navigate(connectionId, 0, 0)  # all stop on lift!
+            self.steer(connectionId, 0, 0)  # all stop on lift!
         else:  # tagetting stops where you leave it
-            self.navigate(connectionId, x, y)  # just the final move location
+            self.steer(connectionId, x, y)  # just the final move location
         return
 
     def navigate(self, connectionId, x, y):
         # ## print("CommsController.navigate: connectionId =", connectionId,
         # ##       "(x, y) =", (dp2(x), dp2(y)))
         # default action is to call the boat's navigation with ID and position
+        # (or aim a turret, for targeting connections on boats with them)
         if self.boat:
-            self.boat.navigate(x, y)
+            if connectionId > 0 and hasattr(self.boat, "aim"):
+                self.boat.aim(connectionId - 1, x, y)
+            else:
+                self.boat.navigate(x, y)
         return
 
     def double(self, connectionId, x, y):
         # called by a listener that recieves a double-click at a position
         # allow doble click to swap listener from Navigate to Target and back
+        if trace.on:
+            trace.record(DOUBLE, connectionId, x, y)
         listener = self.listeners[connectionId]
         newId = 1 - connectionId  # swap to the other
         if connectionId == 0:  # navigate
@@ -264,8 +341,11 @@ class CommsServer(Thread):
                 # wait for connection on the receiver
                 # ## print(f"CommsServer.run({loop}) Waiting for connection")
                 connection = self.receiver.accept()
+                if not self.ok:
+                    break  # shut down while waiting
                 # convert connection into a listener
-                # ## print(f"CommsServer.run({loop}) Connection received, making Listener ...")
+                if trace.on:
+                    trace.record(ACCEPTED, self.serverId, loop)
                 listener = self.makeListener(connection)
                 # let the controller know and start it listening
                 # ## print(f"CommsServer.run({loop}) Controller given Listener ...")
@@ -277,7 +357,8 @@ class CommsServer(Thread):
             except Exception as e:
                 print(f"CommsServer.run({loop}) conection exception:", e)
                 self.ok = False
-        # ## print(f"CommsServer.run{loop} Server stopped")
+        if trace.on:
+            trace.record(SERVER_STOPPED, self.serverId, loop)
         self.controller.stopping(self.serverId)
         return
 
@@ -364,7 +445,8 @@ class CommsListener(Thread):
             try:
                 # ## print("Waiting for message")
                 message = self.receiver.getMessage()
-                # ## print("Message received, trying to execute ...")
+                if trace.on:
+                    trace.record(MESSAGE, self.connectionId)
                 if message:
                     self.execute(message)
                 else:
@@ -372,11 +454,17 @@ class CommsListener(Thread):
             except Exception as e:
                 print("CommsListener exception:", e)
                 self.ok = False
-        # ## print("Listener stopped")
+        if trace.on:
+            trace.record(LISTENER_STOPPED, self.connectionId)
         if self.controller:
             self.controller.disconnected(self.connectionId)
         return
 
+    def dispatch(self, method, *args):
+        # pass a call from a callback on to the controller (directly, here)
+        method(*args)
+        return
+
     #
     # these should be overridden
     #
@@ -386,20 +474,22 @@ class CommsListener(Thread):
         return MessageReceiver(setup=connection)
 
     def execute(self, message):
-        # should be overridden
-        x = 1
-        y = -1
-        if message[0].lower() == "p":
-            self.controller.press(self.connectionId, x, y)
-        elif message[0].lower() == "m":
-            self.controller.move(self.connectionId, x, y)
-        elif message[0].lower() == "l":
-            self.controller.lift(self.connectionId, x, y)
-        elif message[0].lower() == "d":
-            self.controller.double(self.connectionId, x, y)
-        elif message[0].lower() == "c":
+        # a text message (just the action's letter, no position)
+        # or ControlProtocol frames, as many as the message holds
+        if isinstance(message, str):
+            self.perform(ord(message[0].lower()), 1, -1)
+        else:
+            for opcode, connection, sequence, stamp, x, y in decodeAll(message):
+                self.perform(opcode, x, y)
+        return
+
+    def perform(self, opcode, x, y):
+        action = ACTIONS.get(opcode)
+        if action:
+            getattr(self.controller, action)(self.connectionId, x, y)
+        elif opcode == CLOSE:
             self.receiver.close()
-        elif message[0].lower() == "e":
+        elif opcode == ERROR:
             raise Exception("Disconnected by exception")
         return
 
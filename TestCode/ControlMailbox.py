@@ -0,0 +1,120 @@
+# !/usr/bin/python3
+"""
+ControlMailbox - passing stick positions to the boat, newest only
+Listeners would otherwise drive the boat (and every BoatListener)
+on their own threads, one event at a time, so a burst of moves
+queues up behind slow pin writes and redraws.
+Instead each connection has one slot: a new position replaces any
+not yet used, and a single thread applies whatever is newest.
+"""
+
+import time
+from threading import Thread, Condition
+
+from TestCode.Trace import trace
+
+APPLIED = trace.event("mailbox.applied", "connection", "x", "y", "age")
+LATE = trace.event("mailbox.late", "connection", "age")
+
+
+class ControlMailbox(Thread):
+    '''
+    Applies the newest (x, y) posted for each connection with
+    apply(connectionId, x, y), on its own thread.
+
+    posted counts positions posted, applied those applied and
+    coalesced those replaced by a newer one before being applied
+    (the only ones never applied).
+    The newest position is always applied, however long it waited,
+    as it is still the latest command (BlueDot, for one, only sends
+    changes), but one older than maxAge seconds is counted in late
+    (and traced) as a sign the boat is not keeping up.
+    age is how long positions waited to be applied: last, worst and mean.
+    '''
+
+    def __init__(self, apply, maxAge=0.25):
+        Thread.__init__(self, daemon=True)
+        self.apply = apply
+        self.maxAge = maxAge
+        self.posted = 0
+        self.applied = 0
+        self.coalesced = 0
+        self.late = 0
+        self.lastAge = 0.0
+        self.worstAge = 0.0
+        self._totalAge = 0.0
+        self._pending = {}  # connectionId -> (x, y, posted time)
+        self._changed = Condition()
+        self.ok = False
+        return
+
+    def post(self, connectionId, x, y):
+        # from any thread, never waits for the boat
+        with self._changed:
+            if connectionId in self._pending:
+                self.coalesced += 1
+            self._pending[connectionId] = (x, y, time.monotonic())
+            self.posted += 1
+            self._changed.notify()
+        return
+
+    def shutdown(self):
+        with self._changed:
+            self.ok = False
+            self._changed.notify()
+        return
+
+    def meanAge(self):
+        if not self.applied:
+            return 0.0
+        return self._totalAge / self.applied
+
+    def stats(self):
+        return {"posted": self.posted, "applied": self.applied,
+                "coalesced": self.coalesced, "late": self.late,
+                "lastAge": self.lastAge, "worstAge": self.worstAge,
+                "meanAge": self.meanAge()}
+
+    def run(self):
+        self.ok = True
+        while True:
+            with self._changed:
+                while self.ok and not self._pending:
+                    self._changed.wait()
+                if not self.ok:
+                    break
+                pending, self._pending = self._pending, {}
+            now = time.monotonic()
+            for connectionId, (x, y, posted) in pending.items():
+                age = now - posted
+                if age > self.maxAge:
+                    self.late += 1
+                    if trace.on:
+                        trace.record(LATE, connectionId, age)
+                self.lastAge = age
+                if age > self.worstAge:
+                    self.worstAge = age
+                self._totalAge += age
+                self.applied += 1
+                if trace.on:
+                    trace.record(APPLIED, connectionId, x, y, age)
+                self.apply(connectionId, x, y)
+        return
+
+
+if __name__ == '__main__':
+    # for testing, a burst of moves into a slow boat
+    applied = []
+
+    def slow(connectionId, x, y):
+        time.sleep(0.01)  # pin writes and a redraw
+        applied.append((connectionId, x, y))
+
+    mailbox = ControlMailbox(slow)
+    mailbox.start()
+    for i in range(1000):
+        mailbox.post(0, i / 1000.0, 0.5)
+        time.sleep(0.0005)
+    time.sleep(0.1)
+    mailbox.shutdown()
+    print(mailbox.stats(), "last applied:", applied[-1])
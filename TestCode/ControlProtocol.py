@@ -0,0 +1,126 @@
+# !/usr/bin/python3
+"""
+ControlProtocol - the binary control message format
+Every message is one fixed size frame, little endian:
+
+    opcode      B   what to do (PRESS, MOVE, LIFT, DOUBLE, CLOSE, ERROR,
+                    or SESSION from a server, naming the connection)
+    connection  B   the sender's connection (for transports sharing one socket)
+    sequence    H   counts up (and wraps) for each frame from a sender
+    timestamp   I   sender's clock in milliseconds (and wraps)
+    x, y        h   stick position, -1.0 to 1.0 as -32767 to 32767
+
+The opcodes are the letters of the old text messages ("p", "m", ...),
+so both kinds of message dispatch through the same table.
+A buffer holding many frames is decoded in a single pass, without
+copying, and a FrameParser carries any part frame over to the next
+read for stream transports.
+"""
+
+import struct
+import time
+
+FRAME = struct.Struct("<BBHIhh")
+SCALE = 32767
+
+PRESS = ord("p")
+MOVE = ord("m")
+LIFT = ord("l")
+DOUBLE = ord("d")
+CLOSE = ord("c")
+ERROR = ord("e")
+SESSION = ord("s")
+
+# opcode -> the controller method it calls
+ACTIONS = {PRESS: "press", MOVE: "move", LIFT: "lift", DOUBLE: "double"}
+
+
+def quantise(value):
+    # -1.0 <= value <= 1.0 to a frame's x or y
+    if value >= 1.0:
+        return SCALE
+    if value <= -1.0:
+        return -SCALE
+    return int(round(value * SCALE))
+
+
+def timestamp():
+    return int(time.monotonic() * 1000) & 0xFFFFFFFF
+
+
+def newer(sequence, last):
+    """
+    Whether sequence comes after last, allowing for wrapping.
+    """
+    return 0 < ((sequence - last) & 0xFFFF) < 0x8000
+
+
+def encode(opcode, connection, sequence, x, y, stamp=None):
+    if stamp is None:
+        stamp = timestamp()
+    return FRAME.pack(opcode, connection, sequence & 0xFFFF, stamp & 0xFFFFFFFF,
+                      quantise(x), quantise(y))
+
+
+def decodeAll(buffer):
+    """
+    Decode every whole frame in buffer (bytes, bytearray or memoryview),
+    returns a list of (opcode, connection, sequence, timestamp, x, y)
+    with x and y back as floats.  Any part frame at the end is ignored.
+    """
+    view = memoryview(buffer)
+    end = len(view) - len(view) % FRAME.size
+    return [(opcode, connection, sequence, stamp, x / SCALE, y / SCALE)
+            for opcode, connection, sequence, stamp, x, y in FRAME.iter_unpack(view[:end])]
+
+
+class FrameEncoder():
+    '''
+    Makes the frames for one connection, numbering them in turn.
+    '''
+
+    def __init__(self, connection=0):
+        self.connection = connection
+        self.sequence = 0
+        return
+
+    def frame(self, opcode, x=0.0, y=0.0):
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        return encode(opcode, self.connection, self.sequence, x, y)
+
+
+class FrameParser():
+    '''
+    Decodes frames from a stream read in arbitrary sized pieces.
+
+    feed() returns the frames completed by the data given (as
+    decodeAll()) and keeps any part frame for the next call,
+    whole() just returns their bytes, for decoding later.
+    '''
+
+    def __init__(self):
+        self._partial = b""
+        return
+
+    def whole(self, data):
+        if self._partial:
+            data = self._partial + data
+        end = len(data) - len(data) % FRAME.size
+        self._partial = bytes(data[end:])
+        return bytes(data[:end])
+
+    def feed(self, data):
+        return decodeAll(self.whole(data))
+
+
+if __name__ == '__main__':
+    # for testing, decoding a large buffer in one go
+    encoder = FrameEncoder(1)
+    data = b"".join(encoder.frame(MOVE, i / 10000.0, -0.5) for i in range(10000))
+    start = time.perf_counter()
+    frames = decodeAll(data)
+    print(f"{len(frames)} frames, {(time.perf_counter() - start) / len(frames) * 1e9:.0f}ns a frame")
+    print(frames[0], frames[-1])
+    parser = FrameParser()
+    pieces = [data[i:i + 7] for i in range(0, 700, 7)]
+    print("streamed:", sum(len(parser.feed(piece)) for piece in pieces), "frames from 700 bytes")
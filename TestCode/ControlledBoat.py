@@ -25,6 +25,8 @@ class ControlledBoat(CommsController):
         print("super()=", super())
         print("super().__init__=", super().__init__)
         '''
+        # before the server starts, as it may connect straight away
+        self.boatListeners = []
         super().__init__(boat=boat, server=controller)
         '''
         if controller:
@@ -32,7 +34,6 @@ class ControlledBoat(CommsController):
         '''
 
         # add in any listener
-        self.boatListeners = []
         if listener:
             self.addBoatListener(listener)
         return
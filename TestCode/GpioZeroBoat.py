@@ -12,6 +12,17 @@ they had to be implemented in a more specific way.
 
 from gpiozero import SourceMixin, CompositeDevice, Motor, Servo, Pin, Device, GPIOPinMissing
 
+from TestCode.BoatMixer import mix, mixAll, MixingTable
+from TestCode.BoatOutputs import setValue, noFlush, OutputCoalescer, BankedOutput, makeBank
+from TestCode.ActuatorScheduler import ActuatorScheduler
+from TestCode.Calibration import CorrectedOutput
+from TestCode.Trace import trace
+
+NAVIGATE = trace.event("boat.navigate", "x", "y", "left", "right", "center", "rudder")
+VALUE = trace.event("boat.value", "left", "right", "center", "rudder")
+REVERSE = trace.event("boat.reverse")
+STOP = trace.event("boat.stop")
+
 
 def dp2(number):
     return format(number, "03.2f")
@@ -22,7 +33,8 @@ def checkMotor(name, pins, pwm=True, pin_factory=None):
     motor = None
     if isinstance(pins, tuple):
         # ## print("pins are tuple")
-        motor = Motor(*pins, pwm=pwm, pin_factory=pin_factory)
+        enable = pins[2] if len(pins) > 2 else None
+        motor = Motor(pins[0], pins[1], enable=enable, pwm=pwm, pin_factory=pin_factory)
     elif isinstance(pins, Motor):
         # ## print("pins are Motor")
         motor = pins
@@ -36,6 +48,20 @@ def checkMotor(name, pins, pwm=True, pin_factory=None):
     return motor, pins
 
 
+def ratio(name, doc):
+    # a balancing ratio property, changing it retunes the mixing
+    attribute = "_" + name
+
+    def get(self):
+        return getattr(self, attribute)
+
+    def set(self, value):
+        setattr(self, attribute, value)
+        self._retune()
+
+    return property(get, set, doc=doc)
+
+
 class GPIOZeroBoat(SourceMixin, CompositeDevice):
     """
     Extends :class:`CompositeDevice` to represent a generic tri-motor and rudder (servo) boat.
@@ -73,6 +99,10 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
        See :doc:`api_pins` for more information (this is an advanced feature
        which most users can ignore).
 
+    :param Turrets turrets:
+       The :class:`Turrets` aimed by the targeting connections, if any
+       (keyword only).
+
     .. attribute:: left_motor
 
        The :class:`Motor` on the left of the boat.
@@ -90,7 +120,14 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
        The :class:`Servo` for the rudder of the boat.
     """
 
-    def __init__(self, left=None, right=None, center=None, rudder=None, pwm=True, pin_factory=None, *args):
+    thrustDelta = ratio("thrustDelta", "ratio from rudder setting to thrust modification")
+    leftDelta = ratio("leftDelta", "ratio to reduce left hand motor by to balance")
+    rightDelta = ratio("rightDelta", "ratio to reduce right hand motor by to balance")
+    centerDelta = ratio("centerDelta", "ratio to reduce center motor by to balance")
+    toServo = ratio("toServo", "ratio to adjust rudder setting to match servo range")
+
+    def __init__(self, left=None, right=None, center=None, rudder=None, pwm=True, pin_factory=None, *args,
+                 turrets=None):
         # *args is a hack to ensure a useful message is shown when pins are
         # supplied as sequential positional arguments e.g. 2, 3, 4, 5
 
@@ -119,7 +156,7 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
 
         if rudder:
             if not isinstance(rudder, Servo):
-                rudder = Servo(rudder)
+                rudder = Servo(rudder, pin_factory=pin_factory)
         else:
             raise GPIOPinMissing('Must provide a Servo as a rudder')
 
@@ -149,10 +186,13 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
             items["center_motor"] = center_motor
             order.append("center_motor")
         self.motors = tuple(motors)
+        # which of (left, right, center) each motor is
+        self._slots = tuple(("left_motor", "right_motor", "center_motor").index(name)
+                            for name in order)
         items["rudder"] = rudder
         order.append("rudder")
         items["pin_factory"] = pin_factory
-        super(GPIOZeroBoat, self).__init__(**items)
+        super(GPIOZeroBoat, self).__init__(_order=order, **items)
 
         '''
         balancing ratios:
@@ -163,6 +203,14 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
         centerDelta  - ratio to reduce center motor by to balance
         toServo      - ratio to adjust rudder setting to match servo range
         '''
+        self._mixer = None  # optional MixingTable, see mixingOn()
+        self._coalescer = None  # optional OutputCoalescer, see coalesceOn()
+        self._write = setValue  # how navigate() writes to devices
+        self._scheduler = None  # optional ActuatorScheduler, see scheduleOn()
+        self._banked = None  # optional BankedOutput, see bankOn()
+        self._corrected = None  # optional CorrectedOutput, see calibrationOn()
+        self._flush = noFlush  # after navigate() writes
+        self.turrets = turrets
         self.thrustDelta = 1.0
         self.leftDelta = 1.0
         self.rightDelta = 1.0
@@ -177,8 +225,7 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
         if self.center_motor:
             self.center_motor.stop()
         self.rudder.mid()
-        # LimmitedSteppers are assumed to be in default position
-        self._debug = False
+        # LimitedSteppers are assumed to be in default position
         return
 
     @property
@@ -194,13 +241,15 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
     # this should be done on the gpioZeroBoat side of things ...
     @value.setter
     def value(self, value):
-        values = tuple(value)
-        for motor in self.motors:
-            motor.value = values[0]
-            values = values[1:]
-        self.rudder.value = values[0]
-        values = values[1:]
-        self.debug("set value:", self.value)
+        if self._scheduler:
+            # jump the scheduler there too, or its next tick slews back
+            self._scheduler.reset(tuple(value) + self._scheduler.targets[len(value):])
+        write = self._write
+        for device, setting in zip(self.motors + (self.rudder,), value):
+            write(device, setting)
+        self._flush()
+        if trace.on:
+            trace.record(VALUE, *value)
         return
 
     def navigate(self, x, y):
@@ -223,43 +272,202 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
         adjustable / definable to balance any natural imperfections.
            self.leftDelta, self.rightDelta (and possibly) self.centerDelta covers this.
         """
-        left, right, center = y, y, y  # straight ahead
-        rudder = x
-        if x < 0:  # turn left
-            if y < 0:  # going backward
-                cap = 1.0 + y  # max amount we change by
-                delta = -min(-x * self.thrustDelta, cap)
-            else:  # going forwards
-                cap = 1.0 - y  # max amount we change by
-                delta = min(-x * self.thrustDelta, cap)
-            left -= delta
-            right += delta
-        else:  # turn right
-            if y < 0:  # going backward
-                cap = 1.0 + y  # max amount we change by
-                delta = -min(x * self.thrustDelta, cap)
-            else:  # going forwards
-                cap = 1.0 - y  # max amount we change by
-                delta = min(x * self.thrustDelta, cap)
-            left += delta
-            right -= delta
-        # print("Setting LRC+:", int(100*left), int(100*right),
-        #       int(100*center), int(100*rudder))
-        left *= self.leftDelta
-        right *= self.rightDelta
-        center *= self.centerDelta
-        rudder *= self.toServo
-        # print("Actual LRC+:", int(100*left), int(100*right),
-        #       int(100*center), int(100*rudder))
+        if self._mixer:
+            left, right, center, rudder = self._mixer.lookup(x, y)
+        else:
+            left, right, center, rudder = mix(x, y, **self.ratios())
+        if trace.on:
+            trace.record(NAVIGATE, x, y, left, right, center, rudder)
+        if self._scheduler:
+            motors = (left, right, center)
+            self._scheduler.post(*(tuple(motors[i] for i in self._slots) + (rudder,)))
+            return
+        write = self._write
         if self.left_motor:
-            self.left_motor.value = left
+            write(self.left_motor, left)
         if self.right_motor:
-            self.right_motor.value = right
+            write(self.right_motor, right)
         if self.center_motor:
-            self.center_motor.value = center
-        self.rudder.value = rudder
+            write(self.center_motor, center)
+        write(self.rudder, rudder)
+        self._flush()
+        return
+
+    def aim(self, turret, x, y):
+        """
+        Aim a turret (0 is the first) with the joystick position (x, y),
+        the stepper scheduler moves it there in the background.
+        """
+        if self.turrets:
+            self.turrets.aim(turret, x, y)
+        return
+
+    def ratios(self):
+        """
+        Returns the balancing ratios as a dictionary (as taken by BoatMixer.mix()).
+        """
+        return {
+            "thrustDelta": self._thrustDelta,
+            "leftDelta": self._leftDelta,
+            "rightDelta": self._rightDelta,
+            "centerDelta": self._centerDelta,
+            "toServo": self._toServo,
+        }
+
+    def mixingOn(self, resolution=41, interpolate=True):
+        """
+        Use a precomputed MixingTable in navigate().
+
+        :param int resolution:
+           The number of points across each axis of the table.
+
+        :param bool interpolate:
+           If :data:`True` (the default) interpolate between points,
+           otherwise use the nearest point.
+        """
+        self._mixer = MixingTable(resolution=resolution, interpolate=interpolate,
+                                  **self.ratios())
+        return
+
+    def mixingOff(self):
+        self._mixer = None
+        return
+
+    def coalesceOn(self, epsilon=0.005):
+        """
+        Skip writes to a motor or the rudder that are within epsilon
+        of the last value written to it.  See :attr:`coalescer` for counts.
+        """
+        self._coalescer = OutputCoalescer(epsilon=epsilon)
+        self._rewire()
+        return
+
+    def coalesceOff(self):
+        self._coalescer = None
+        self._rewire()
+        return
+
+    def bankOn(self, bank=None, threshold=0.5):
+        """
+        Write the direction pins of digital (pwm=False) motors together,
+        as pigpio bank operations, once per update.
+
+        :param bank:
+           Where to send the bank writes, by default made to suit the
+           pin factory (:class:`PiGPIOBank` or :class:`MockBank`).
+
+        :param float threshold:
+           How far the stick must go to drive a digital motor.
+        """
+        if bank is None:
+            bank = makeBank(self.pin_factory)
+        self._banked = BankedOutput(bank, self.motors, threshold=threshold)
+        self._rewire()
         return
 
+    def bankOff(self):
+        self._banked = None
+        self._rewire()
+        return
+
+    def calibrationOn(self, profile):
+        """
+        Use a :class:`TrimProfile`: its balancing ratios, and its
+        correction tables for every write to the actuators it has them for.
+        """
+        for name, value in profile.ratios.items():
+            setattr(self, name, value)
+        tables = {getattr(self, name): table for name, table in profile.tables.items()
+                  if getattr(self, name, None) is not None}
+        self._corrected = CorrectedOutput(tables)
+        self._rewire()
+        return
+
+    def calibrationOff(self):
+        self._corrected = None
+        self._rewire()
+        return
+
+    def _rewire(self):
+        # chain the writers: corrected, banked, then coalesced, then the device
+        write = setValue
+        flush = noFlush
+        if self._coalescer:
+            write = self._coalescer.write
+        if self._banked:
+            self._banked.fallback = write
+            write = self._banked.write
+            flush = self._banked.flush
+        if self._corrected:
+            self._corrected.fallback = write
+            write = self._corrected.write
+        self._write = write
+        self._flush = flush
+        if self._scheduler:
+            self._scheduler.write = write
+            self._scheduler.flush = flush
+        return
+
+    def scheduleOn(self, rate=100.0, slew=None, acceleration=None):
+        """
+        Hand the motors and rudder to an :class:`ActuatorScheduler`,
+        so navigate() just posts targets and the scheduler moves
+        towards them rate times a second.
+
+        :param float rate:
+           Updates per second.
+
+        :param slew:
+           Most change per second, for all or per actuator (motors then rudder).
+
+        :param acceleration:
+           Most change in slew per second, for all or per actuator.
+        """
+        self.scheduleOff()
+        self._scheduler = ActuatorScheduler(
+            self.motors + (self.rudder,), rate=rate, slew=slew,
+            acceleration=acceleration, write=self._write, flush=self._flush)
+        self._scheduler.start()
+        return
+
+    def scheduleOff(self):
+        if self._scheduler:
+            self._scheduler.shutdown()
+            self._scheduler.join()
+            self._scheduler = None
+        return
+
+    @property
+    def scheduler(self):
+        """
+        The :class:`ActuatorScheduler` in use, or None.
+        """
+        return self._scheduler
+
+    @property
+    def coalescer(self):
+        """
+        The :class:`OutputCoalescer` in use, or None.
+        """
+        return self._coalescer
+
+    def _retune(self):
+        # the ratios have changed, so any table needs rebuilding
+        if self._mixer and hasattr(self, "_toServo"):
+            self._mixer.build(**self.ratios())
+        return
+
+    def mixAll(self, xs, ys):
+        """
+        Mix whole sequences of stick positions without driving the boat,
+        for tuning and simulation.
+
+        Returns four arrays: left, right, center and rudder.
+        """
+        if self._mixer:
+            return self._mixer.mixAll(xs, ys)
+        return mixAll(xs, ys, **self.ratios())
+
     def forward(self, speed=1, **kwargs):
         """
         Drive the boat forward by running all motors forward.
@@ -291,8 +499,7 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
         if curve_left != 0 and curve_right != 0:
             raise ValueError("curve_left and curve_right can't be used at "
                              "the same time")
-        self.joystick(curve_right - curve_left, speed)
-        self.debug("forward:", self.value)
+        self.navigate(curve_right - curve_left, speed)
         return
 
     def backward(self, speed=1, **kwargs):
@@ -326,8 +533,7 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
         if curve_left != 0 and curve_right != 0:
             raise ValueError("curve_left and curve_right can't be used at "
                              "the same time")
-        self.joystick(curve_right - curve_left, -speed)
-        self.debug("backward:", self.value)
+        self.navigate(curve_right - curve_left, -speed)
         return
 
     def left(self, speed=1):
@@ -339,8 +545,7 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
            Speed at which to drive the motors, as a value between 0 (stopped)
            and 1 (full speed). The default is 1.
         """
-        self.joystick(-speed, 0)
-        self.debug("left:", self.value)
+        self.navigate(-speed, 0)
         return
 
     def right(self, speed=1):
@@ -352,8 +557,7 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
            Speed at which to drive the motors, as a value between 0 (stopped)
            and 1 (full speed). The default is 1.
         """
-        self.joystick(speed, 0)
-        self.debug("right:", self.value)
+        self.navigate(speed, 0)
         return
 
     def reverse(self):
@@ -363,35 +567,46 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
         robot is turning left at half-speed, it will turn right at half-speed.
         If the robot is currently stopped it will remain stopped.
         """
-        self.left_motor.reverse()
-        self.right_motor.reverse()
-        self.center_motor.reverse()
+        if self._scheduler:
+            # the scheduler's targets and positions, so it carries on reversed
+            self._scheduler.reverse(range(len(self.motors)))
+        else:
+            for motor in self.motors:
+                motor.reverse()
+        if self._coalescer:
+            self._coalescer.forget()
+        if self._banked:
+            self._banked.forget()
         # don't change rudder
-        self.debug("reverse:", self.value)
+        if trace.on:
+            trace.record(REVERSE)
         return
 
     def stop(self):
         """
         Stop the boat.
         """
-        self.left_motor.stop()
-        self.right_motor.stop()
-        self.center_motor.stop()
+        if self._scheduler:
+            # waits for a tick in progress, so the stops below are last
+            self._scheduler.reset((0.0,) * (len(self.motors) + 1))
+        for motor in self.motors:
+            motor.stop()
         self.rudder.mid()
-        self.debug("stop:", self.value)
+        if self._coalescer:
+            self._coalescer.forget()
+        if self._banked:
+            self._banked.forget()
+        if trace.on:
+            trace.record(STOP)
         return
 
     def debugOn(self):
-        self._debug = True
+        # trace everything as text to stdout, see Trace
+        trace.start()
         return
 
     def debugOff(self):
-        self._debug = False
-        return
-
-    def debug(self, *args):
-        if self._debug:
-            print(*args)
+        trace.stop()
         return
 
     def report(self):
@@ -401,6 +616,8 @@ class GPIOZeroBoat(SourceMixin, CompositeDevice):
         result = []
         for pin in self.pins:
             result.append(pin.state)
+        if self.turrets:
+            result += self.turrets.positions()
         return result
 
 
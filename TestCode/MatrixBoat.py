@@ -0,0 +1,183 @@
+# !/usr/bin/python3
+"""
+MatrixBoat - A Boat with any number of motors and servos
+A generalisation of GPIOZeroBoat where the control inputs
+(usually the joystick x and y) are mixed to the actuators
+by a matrix, rather than being coded for three motors and a rudder.
+"""
+
+from array import array
+from operator import mul
+
+from gpiozero import SourceMixin, CompositeDevice, Servo, Pin, Device, GPIOPinMissing
+
+from TestCode.GpioZeroBoat import checkMotor
+
+
+class MatrixBoat(SourceMixin, CompositeDevice):
+    """
+    Extends :class:`CompositeDevice` to represent a boat with any number
+    of motors and servos, driven through a mixing matrix.
+
+    :param motors:
+       A sequence of motors, each a tuple of two (or three) GPIO pins
+       (as for :class:`GPIOZeroBoat`) or a :class:`Motor`.
+       They are named motor_0, motor_1 and so on.
+
+    :param servos:
+       A sequence of servos, each a GPIO pin or a :class:`Servo`.
+       They are named servo_0, servo_1 and so on.
+
+    :param matrix:
+       One row per actuator (motors then servos), each row having one
+       coefficient per control input.  Each update sets every actuator
+       to its row times the inputs, capped to -1 to 1.
+       The default passes input 0 (x) to the servos and input 1 (y)
+       to the motors.
+
+    :param bool pwm:
+       As for :class:`GPIOZeroBoat`.
+
+    :type pin_factory: Factory or None
+    :param pin_factory:
+       See :doc:`api_pins` for more information.
+    """
+
+    def __init__(self, motors=(), servos=(), matrix=None, pwm=True, pin_factory=None):
+        if not motors:
+            raise GPIOPinMissing('At least one motor must be given')
+
+        items = {}
+        order = []
+        pins = []
+        made = []
+        for i, motor in enumerate(motors):
+            motor, motor_pins = checkMotor(
+                f"motor {i}", motor, pwm=pwm, pin_factory=pin_factory)
+            items[f"motor_{i}"] = motor
+            order.append(f"motor_{i}")
+            made.append(motor)
+            pins += list(motor_pins)
+        servo_devices = []
+        for i, servo in enumerate(servos):
+            if not isinstance(servo, Servo):
+                servo = Servo(servo, pin_factory=pin_factory)
+            items[f"servo_{i}"] = servo
+            order.append(f"servo_{i}")
+            servo_devices.append(servo)
+            pins.append(servo.pwm_device)
+        for i in range(len(pins)):
+            if isinstance(pins[i], Device):
+                pins[i] = pins[i].pin
+            elif not isinstance(pins[i], Pin):
+                if pin_factory:
+                    pins[i] = pin_factory.pin(pins[i])
+                else:
+                    pins[i] = Device.pin_factory.pin(pins[i])
+        self.pins = pins
+        self.motors = tuple(made)
+        self.servos = tuple(servo_devices)
+        self.actuators = self.motors + self.servos
+
+        if matrix is None:
+            matrix = [(0.0, 1.0)] * len(self.motors) + [(1.0, 0.0)] * len(self.servos)
+        self.matrix = matrix
+
+        super(MatrixBoat, self).__init__(_order=order, pin_factory=pin_factory, **items)
+        self.stop()
+        return
+
+    @classmethod
+    def triMotor(cls, left, right, center, rudder, thrustDelta=1.0, pwm=True, pin_factory=None):
+        """
+        The :class:`GPIOZeroBoat` layout: left, right and center motors and a rudder.
+
+        y drives all three motors and x turns by adding thrustDelta * x to the
+        left motor and taking it from the right.
+        Unlike :meth:`GPIOZeroBoat.navigate` a motor at full throttle is simply
+        capped, rather than limiting the turn for both.
+        """
+        matrix = [(thrustDelta, 1.0),  # left
+                  (-thrustDelta, 1.0),  # right
+                  (0.0, 1.0),  # center
+                  (1.0, 0.0)]  # rudder
+        return cls(motors=(left, right, center), servos=(rudder,), matrix=matrix,
+                   pwm=pwm, pin_factory=pin_factory)
+
+    @property
+    def matrix(self):
+        return self._matrix
+
+    @matrix.setter
+    def matrix(self, matrix):
+        rows = tuple(tuple(float(c) for c in row) for row in matrix)
+        if len(rows) != len(self.actuators):
+            raise ValueError('matrix must have one row per actuator')
+        self._matrix = rows
+        self._outputs = array('d', bytes(8 * len(rows)))  # reused by every update
+        return
+
+    @property
+    def value(self):
+        """
+        Represents the actuators as a tuple of motor speeds
+        then servo positions.
+        """
+        return super(MatrixBoat, self).value
+
+    @value.setter
+    def value(self, value):
+        for device, setting in zip(self.actuators, value):
+            device.value = setting
+        return
+
+    def update(self, *inputs):
+        """
+        Set every actuator from the control inputs through the matrix.
+        """
+        outputs = self._outputs
+        for i, row in enumerate(self._matrix):
+            total = sum(map(mul, row, inputs))
+            if total > 1.0:
+                total = 1.0
+            elif total < -1.0:
+                total = -1.0
+            outputs[i] = total
+        for device, setting in zip(self.actuators, outputs):
+            device.value = setting
+        return
+
+    def navigate(self, x, y):
+        """
+        Control the boat with the joystick position (x, y).
+        """
+        self.update(x, y)
+        return
+
+    def reverse(self):
+        """
+        Reverse the boat's current motor directions, leaving the servos.
+        """
+        for motor in self.motors:
+            motor.reverse()
+        return
+
+    def stop(self):
+        """
+        Stop the boat.
+        """
+        for motor in self.motors:
+            motor.stop()
+        for servo in self.servos:
+            servo.mid()
+        return
+
+    def report(self):
+        '''
+        Report on the state of this device as list of pin values.
+        '''
+        return [pin.state for pin in self.pins]
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,292 @@
+# !/usr/bin/python3
+"""
+PinPlanner - choosing the Pi's pins for a boat
+PWM done in software costs CPU for every channel, all the time,
+so the pins that carry PWM (servos, and the forward and backward
+pins of motors, as gpiozero's Motor holds any enable pin high) are
+put on the hardware PWM pins first.  The planner also checks for
+pins used twice or clashing with reserved ones (such as I2C for the
+turrets), and reports which outputs are left on software PWM and
+roughly what they will cost.
+"""
+
+from collections import namedtuple
+
+# hardware PWM pin -> channel, 12 and 18 share channel 0, 13 and 19 channel 1
+HARDWARE_PWM = {12: 0, 13: 1, 18: 0, 19: 1}
+I2C = (2, 3)  # data, clock (used by the turrets)
+HAT_EEPROM = (0, 1)  # ID_SD, ID_SC (add to reserved when a HAT is fitted)
+UART = (14, 15)  # tx, rx (add to reserved when using SerialController on the UART)
+RESERVED = I2C
+GPIO_PINS = tuple(range(2, 28))  # the general purpose pins on the 40 pin header
+
+# rough % of one core for each software PWM channel at 100Hz, by pin factory
+# (guesses to check with top on the boat's own Pi)
+SOFTWARE_PWM_COST = {
+    "PiGPIOFactory": 0.5,  # the daemon times pulses by DMA, little per channel
+    "LGPIOFactory": 1.5,
+    "RPiGPIOFactory": 1.5,
+    "NativeFactory": 5.0,  # a python thread per channel
+    "MockFactory": 0.0,
+}
+DEFAULT_COST = 2.0
+
+# one output of the plan, pins are the gpio numbers (pwm is the pin, or pins, carrying PWM, or None)
+Output = namedtuple("Output", "name kind pins pwm frequency hardware")
+
+AUTO = "auto"  # let the planner choose the pin
+
+
+def reservedFor(pin):
+    # what a reserved pin is kept for, as text for a conflict
+    for name, pins in (("I2C", I2C), ("the HAT EEPROM", HAT_EEPROM), ("the UART", UART)):
+        if pin in pins:
+            return " for " + name
+    return ""
+
+
+def softwareCost(factory=None, frequency=100):
+    # estimated % of one core for a software PWM channel
+    if factory is None:
+        from gpiozero import Device
+        factory = Device.pin_factory
+    name = factory if isinstance(factory, str) else type(factory).__name__
+    return SOFTWARE_PWM_COST.get(name, DEFAULT_COST) * frequency / 100.0
+
+
+class PinPlanner():
+    '''
+    Collects a boat description and plans its pins.
+
+    Describe each motor and servo, then call plan().
+    Any of a motor's pins or a servo's pin may be given as AUTO,
+    in which case the planner picks it.  For pins carrying PWM it
+    takes a hardware PWM pin whose channel is still free if there is
+    one, otherwise a free general purpose pin.  A motor's enable pin
+    is only ever held high, so it is given an ordinary pin.
+    Pins given explicitly are kept, and reported as hardware PWM
+    only if they carry PWM and are the first to use their channel.
+    Servos are planned before motors, as jitter moves a servo
+    while a motor just averages it out.
+
+    reserved pins are never chosen and any use of them is a conflict.
+    '''
+
+    def __init__(self, reserved=RESERVED, available=GPIO_PINS):
+        self.reserved = tuple(reserved)
+        self.available = tuple(available)
+        self._motors = []
+        self._servos = []
+        return
+
+    def motor(self, name, forward, backward, enable=None, pwm=True, frequency=100):
+        """
+        Add a motor.  With pwm both direction pins carry PWM (one at
+        a time), whether or not there is an enable pin, which is digital.
+        """
+        self._motors.append((name, forward, backward, enable, pwm, frequency))
+        return self
+
+    def servo(self, name, pin=AUTO, frequency=50):
+        """
+        Add a servo.
+        """
+        self._servos.append((name, pin, frequency))
+        return self
+
+    def plan(self):
+        fixed = [pin for name, pin, frequency in self._servos if pin != AUTO]
+        carriers = list(fixed)
+        for name, forward, backward, enable, pwm, frequency in self._motors:
+            for pin in (forward, backward):
+                if pin != AUTO:
+                    fixed.append(pin)
+                    if pwm:
+                        carriers.append(pin)
+            if enable not in (None, AUTO):
+                fixed.append(enable)
+        plan = PinPlan(self.reserved)
+        for pin in fixed:
+            plan.claim(pin)
+        # explicit PWM pins get their hardware channels before any are chosen
+        for pin in carriers:
+            if pin in HARDWARE_PWM:
+                plan.channels.setdefault(HARDWARE_PWM[pin], pin)
+        free = [pin for pin in self.available
+                if pin not in self.reserved and pin not in plan.used]
+        for name, pin, frequency in self._servos:
+            if pin == AUTO:
+                pin = self._choose(plan, free)
+            plan.add(Output(name, "servo", (pin,), pin, frequency, plan.isHardware(pin)))
+        for name, forward, backward, enable, pwm, frequency in self._motors:
+            if forward == AUTO:
+                forward = self._choose(plan, free, pwm)
+            if backward == AUTO:
+                backward = self._choose(plan, free, pwm)
+            if enable == AUTO:
+                enable = self._choose(plan, free, False)
+            pins = (forward, backward) if enable is None else (forward, backward, enable)
+            carrier = (forward, backward) if pwm else None
+            hardware = pwm and plan.isHardware(forward) and plan.isHardware(backward)
+            plan.add(Output(name, "motor", pins, carrier, frequency, hardware))
+        return plan
+
+    def _choose(self, plan, free, pwm=True):
+        # for PWM a hardware pin with a free channel, else the first ordinary free pin
+        for pin in free if pwm else ():
+            if pin in HARDWARE_PWM and HARDWARE_PWM[pin] not in plan.channels:
+                plan.channels[HARDWARE_PWM[pin]] = pin
+                break
+        else:
+            for pin in free:
+                if pin not in HARDWARE_PWM:
+                    break
+            else:
+                if not free:
+                    raise ValueError("no free pins left")
+                pin = free[0]
+        free.remove(pin)
+        plan.claim(pin)
+        return pin
+
+
+class PinPlan():
+    '''
+    The pins chosen for each output of a boat.
+
+    outputs are the planned :data:`Output` s in the order planned,
+    channels maps hardware PWM channel to the pin using it,
+    conflicts lists the problems found (a plan with any cannot be built).
+    '''
+
+    def __init__(self, reserved=RESERVED):
+        self.reserved = tuple(reserved)
+        self.outputs = []
+        self.channels = {}
+        self.used = {}  # pin -> times used
+        self.conflicts = []
+        return
+
+    def claim(self, pin):
+        count = self.used.get(pin, 0) + 1
+        self.used[pin] = count
+        if count == 2:
+            self.conflicts.append(f"GPIO{pin} is used more than once")
+        if count == 1 and pin in self.reserved:
+            self.conflicts.append(f"GPIO{pin} is reserved{reservedFor(pin)}")
+        return
+
+    def isHardware(self, pin):
+        return self.channels.get(HARDWARE_PWM.get(pin)) == pin
+
+    def add(self, output):
+        self.outputs.append(output)
+        return
+
+    def __getitem__(self, name):
+        for output in self.outputs:
+            if output.name == name:
+                return output
+        raise KeyError(name)
+
+    def pins(self, name):
+        return self[name].pins
+
+    def software(self):
+        """
+        The PWM pins left to software, as a list of (name, pin, frequency).
+        """
+        pins = []
+        for output in self.outputs:
+            if output.pwm is None or output.hardware:
+                continue
+            carriers = output.pwm if isinstance(output.pwm, tuple) else (output.pwm,)
+            pins += [(output.name, pin, output.frequency) for pin in carriers
+                     if not self.isHardware(pin)]
+        return pins
+
+    def cpu(self, factory=None):
+        """
+        Estimated % of one core spent on software PWM.
+        """
+        return sum(softwareCost(factory, frequency) for name, pin, frequency in self.software())
+
+    def report(self, factory=None):
+        lines = []
+        for output in self.outputs:
+            pins = ", ".join(f"GPIO{pin}" for pin in output.pins)
+            how = "hardware PWM" if output.hardware else \
+                "digital" if output.pwm is None else \
+                "part hardware PWM" if any(self.isHardware(pin) for pin in output.pins) else \
+                "software PWM"
+            lines.append(f"{output.name:8} {output.kind:6} {pins:24} {how}")
+        software = self.software()
+        if software:
+            lines.append(f"{len(software)} software PWM channel(s), "
+                         f"about {self.cpu(factory):.1f}% of a core")
+        for conflict in self.conflicts:
+            lines.append("conflict: " + conflict)
+        return "\n".join(lines)
+
+    def check(self):
+        if self.conflicts:
+            raise ValueError("; ".join(self.conflicts))
+        return
+
+    def motorPwm(self):
+        # whether the planned motors use PWM (a boat's motors all do or all don't)
+        kinds = {output.pwm is not None for output in self.outputs if output.kind == "motor"}
+        if len(kinds) > 1:
+            raise ValueError("motors must all use PWM or all not")
+        return kinds.pop() if kinds else True
+
+    def boat(self, pwm=None, pin_factory=None):
+        """
+        Build a :class:`GPIOZeroBoat` from the outputs left, right,
+        center (any may be missing) and rudder, with PWM motors
+        if they were planned that way (unless pwm is given).
+        """
+        from TestCode.GpioZeroBoat import GPIOZeroBoat
+        self.check()
+        if pwm is None:
+            pwm = self.motorPwm()
+        motors = {}
+        for name in ("left", "right", "center"):
+            try:
+                motors[name] = self.pins(name)
+            except KeyError:
+                motors[name] = None
+        return GPIOZeroBoat(rudder=self.pins("rudder")[0], pwm=pwm,
+                            pin_factory=pin_factory, **motors)
+
+    def matrixBoat(self, matrix=None, pwm=None, pin_factory=None):
+        """
+        Build a :class:`MatrixBoat` with every motor and servo,
+        in the order they were planned.
+        """
+        from TestCode.MatrixBoat import MatrixBoat
+        self.check()
+        if pwm is None:
+            pwm = self.motorPwm()
+        motors = [output.pins for output in self.outputs if output.kind == "motor"]
+        servos = [output.pins[0] for output in self.outputs if output.kind == "servo"]
+        return MatrixBoat(motors=motors, servos=servos, matrix=matrix,
+                          pwm=pwm, pin_factory=pin_factory)
+
+
+def planBoat(left=None, right=None, center=None, rudder=AUTO, reserved=RESERVED):
+    """
+    Plan a :class:`GPIOZeroBoat`, motors given as (forward, backward)
+    or (forward, backward, enable) where any may be AUTO.
+    """
+    planner = PinPlanner(reserved=reserved)
+    planner.servo("rudder", rudder, frequency=50)
+    for name, pins in (("left", left), ("right", right), ("center", center)):
+        if pins:
+            planner.motor(name, *pins)
+    return planner.plan()
+
+
+if __name__ == '__main__':
+    # the left motor and rudder on hardware PWM, the rest chosen
+    print(planBoat((AUTO, AUTO, AUTO), (5, 6, AUTO), (20, 26, AUTO)).report())
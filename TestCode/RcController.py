@@ -0,0 +1,347 @@
+# !/usr/bin/python3
+# RcController - Radio Control controller
+"""
+An implementation of CommsController using a hobby RC transmitter.
+
+The receiver's channels are read either as separate PWM readers
+(one per channel, see testpgpwm) or as a single frame source
+(PPM or SBUS, see rcdecode).  Stick movements are pushed to the
+controller as they happen, from the reader's callbacks, so there
+is no polling delay.  Frame sources that only decode when asked
+(such as testsbus) are polled by the listener instead.
+The stick leaving the center is a press, moving it is a move,
+and returning it to the center is a lift.
+If nothing is heard from the receiver for a while the stick is
+treated as centered, so a lost signal stops the boat.
+"""
+
+import asyncio
+import time
+from threading import Event, Lock
+
+from TestCode.CommsController import CommsServer, CommsListener, CommsReceiver, MessageReceiver, CommsConnection
+from TestCode.AsyncComms import AsyncCommsServer, AsyncCommsListener
+
+
+class RcCalibration():
+    '''
+    Calibration for one channel.
+
+    min, mid and max are pulse widths in microseconds,
+    deadband is the fraction either side of mid treated as centered.
+    '''
+
+    def __init__(self, min=1000, mid=1500, max=2000, deadband=0.05, invert=False):
+        self.min = min
+        self.mid = mid
+        self.max = max
+        self.deadband = deadband
+        self.invert = invert
+        return
+
+    def normalise(self, width):
+        # pulse width to -1.0 <= value <= 1.0
+        if width >= self.mid:
+            value = (width - self.mid) / (self.max - self.mid)
+            if value > 1.0:
+                value = 1.0
+        else:
+            value = (width - self.mid) / (self.mid - self.min)
+            if value < -1.0:
+                value = -1.0
+        if -self.deadband < value < self.deadband:
+            value = 0.0
+        if self.invert:
+            value = -value
+        return value
+
+
+class RcConnection(CommsConnection):
+    '''
+    Describes a transmitter's connection.
+
+    source is either a list of PWM readers (one per channel)
+    or a frame source (such as testppm or testsbus).
+    x and y are the channels (index into the list or frame)
+    for the stick, each with an RcCalibration.
+    step is the smallest change in x or y that is passed on.
+    poll is how often (in seconds) the source is polled and checked.
+    timeout is how long (in seconds) without a pulse or frame
+    before the signal counts as lost and the stick is centered.
+    '''
+
+    def __init__(self, source, x=0, y=1, xCalibration=None, yCalibration=None, step=0.02,
+                 poll=0.02, timeout=0.5):
+        self.source = source
+        self.x = x
+        self.y = y
+        self.xCalibration = xCalibration or RcCalibration()
+        self.yCalibration = yCalibration or RcCalibration()
+        self.step = step
+        self.poll = poll
+        self.timeout = timeout
+        return
+
+    def accept(self):
+        return self
+
+
+# no class RcController()
+class RcServer(CommsServer):
+    '''
+    This is a server for a radio control link.
+
+    There is only one transmitter, so the receiver gives up
+    its connection once and then waits until it is closed.
+    The setup is an RcConnection.
+    '''
+
+    def makeReceiver(self):
+        return RcReceiver(self.setup)
+
+    def makeListener(self, connection):
+        # make an RcListener from the RcConnection
+        listener = None
+        if connection:
+            listener = RcListener(connection, controller=self.controller)
+        return listener
+
+
+class RcReceiver(CommsReceiver):
+
+    def setup(self, setup):
+        self.connection = setup
+        self.closed = Event()
+        return
+
+    def accept(self):
+        connection, self.connection = self.connection, None
+        if connection:
+            return connection
+        self.closed.wait()  # nothing more to accept
+        raise Exception("RcReceiver closed")
+
+    def close(self):
+        self.closed.set()
+        return
+
+
+class RcStick():
+    '''
+    Turns an RC transmitter's stick into press, move and lift,
+    shared by the threaded and the async listeners.
+
+    The reader callbacks come in on the readers' threads and are
+    passed on through dispatch().
+    The listener calls tick() every poll seconds, to read sources
+    without callbacks and to center the stick if the signal is lost.
+    '''
+
+    def attach(self):
+        connection = self.receiver.connection
+        self.x = self.y = 0.0
+        self.pressed = False
+        self.heard = time.monotonic()  # last pulse or frame
+        self._lock = Lock()
+        self._poll = connection.poll
+        self._timeout = connection.timeout
+        self._update = None
+        source = connection.source
+        if isinstance(source, (list, tuple)):
+            self._channels = {}
+            for channel, reader in enumerate(source):
+                self._channels[reader.gpio] = channel
+                reader.when_pulse = self._pulse
+        else:
+            source.decoder.when_frame = self._frame
+            self._update = getattr(source, "update", None)
+        return
+
+    def tick(self):
+        # poll the source, and all stop if nothing has been heard
+        if not self.ok:
+            return
+        if self._update:
+            self._update()
+        if self._timeout and time.monotonic() - self.heard > self._timeout:
+            self.stick(0.0, 0.0)
+        return
+
+    def _pulse(self, gpio, width):
+        self.dispatch(self.pulse, gpio, width)
+        return
+
+    def _frame(self, timestamp, frame):
+        self.dispatch(self.frame, timestamp, frame)
+        return
+
+    def pulse(self, gpio, width):
+        # a pulse from one channel's reader
+        if not self.ok:
+            return  # closed since it was sent
+        self.heard = time.monotonic()
+        connection = self.receiver.connection
+        channel = self._channels.get(gpio)
+        x, y = self.x, self.y
+        if channel == connection.x:
+            x = connection.xCalibration.normalise(width)
+        elif channel == connection.y:
+            y = connection.yCalibration.normalise(width)
+        else:
+            return
+        self.stick(x, y)
+        return
+
+    def frame(self, timestamp, frame):
+        # a frame of all channels
+        if not self.ok:
+            return  # closed since it was sent
+        self.heard = time.monotonic()
+        connection = self.receiver.connection
+        x = connection.xCalibration.normalise(frame[connection.x])
+        y = connection.yCalibration.normalise(frame[connection.y])
+        decoder = connection.source.decoder
+        if hasattr(decoder, "failsafe") and decoder.failsafe():
+            x = y = 0.0  # lost the transmitter - all stop
+        self.stick(x, y)
+        return
+
+    def stick(self, x, y):
+        # pass on any change as press, move or lift
+        # (from the readers and from tick(), so one at a time)
+        step = self.receiver.connection.step
+        x = round(x / step) * step
+        y = round(y / step) * step
+        with self._lock:
+            if x == self.x and y == self.y:
+                return
+            if not self.ok or not self.controller:
+                return
+            if x == 0.0 and y == 0.0:
+                if self.pressed:
+                    self.pressed = False
+                    self.controller.lift(self.connectionId, self.x, self.y)
+            elif self.pressed:
+                self.controller.move(self.connectionId, x, y)
+            else:
+                self.pressed = True
+                self.controller.press(self.connectionId, x, y)
+            self.x, self.y = x, y
+        return
+
+
+class RcListener(RcStick, CommsListener):
+    '''
+    Listener for an RC transmitter.
+
+    The reader callbacks call the controller directly,
+    so run() just ticks until the connection is closed.
+    '''
+
+    def makeReceiver(self, connection):
+        # turn a connection (an RcConnection) into the receiver
+        return RcMessageReceiver(setup=connection)
+
+    def startup(self, connectionId, controller):
+        self.attach()
+        super().startup(connectionId, controller)
+        return
+
+    def run(self):
+        receiver = self.receiver
+        while self.ok and receiver:
+            if receiver.closed.wait(self._poll):
+                self.ok = False
+                break
+            try:
+                self.tick()
+            except Exception as e:
+                print("RcListener exception:", e)
+                self.ok = False
+        # ## print("Listener stopped")
+        if self.controller:
+            self.controller.disconnected(self.connectionId)
+        return
+
+
+class AsyncRcServer(AsyncCommsServer):
+    '''
+    An RcServer on the shared event loop.
+
+    It hands out its one connection and then stops,
+    so once connected it takes no thread at all.
+    '''
+
+    def makeReceiver(self):
+        return RcReceiver(self.setup)
+
+    async def accept(self):
+        connection, self.receiver.connection = self.receiver.connection, None
+        if not connection:
+            self.ok = False  # nothing more to accept
+        return connection
+
+    def makeListener(self, connection):
+        listener = None
+        if connection:
+            listener = AsyncRcListener(connection, controller=self.controller, loop=self.loop)
+        return listener
+
+
+class AsyncRcListener(RcStick, AsyncCommsListener):
+    '''
+    Listener for an RC transmitter on the shared event loop,
+    the reader callbacks are handed over to the loop.
+    '''
+
+    def makeReceiver(self, connection):
+        return RcMessageReceiver(setup=connection)
+
+    def startup(self, connectionId, controller):
+        self.attach()
+        return super().startup(connectionId, controller)
+
+    async def getMessage(self):
+        # tick on the loop until closed
+        closed = asyncio.ensure_future(self.closing())
+        while not closed.done():
+            await asyncio.wait((closed,), timeout=self._poll)
+            if not closed.done():
+                self.tick()
+        return None
+
+
+class RcMessageReceiver(MessageReceiver):
+
+    def setup(self, setup):
+        self.connection = setup
+        self.closed = Event()
+        return
+
+    def getMessage(self):
+        return None
+
+    def close(self):
+        # ## print("RcMessageReciever.close() releasing the readers!")
+        source = self.connection.source
+        if isinstance(source, (list, tuple)):
+            for reader in source:
+                reader.when_pulse = None
+                reader.cancel()
+        else:
+            source.decoder.when_frame = None
+            source.cancel()
+        self.closed.set()
+        return
+
+
+if __name__ == '__main__':
+    # for testing
+    from TestCode.CommsController import CommsController
+    from TestCode.testpgpwm import testpgpwm
+
+    rudder_GPIO = 4
+    motor_GPIO = 5
+    server = RcServer(RcConnection(
+        [testpgpwm(rudder_GPIO), testpgpwm(motor_GPIO)]))
+    controller = CommsController(server=server)
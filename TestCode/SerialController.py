@@ -0,0 +1,338 @@
+# !/usr/bin/python3
+# SerialController - serial (telemetry radio) controller
+"""
+An implementation of CommsController over a serial link,
+such as a telemetry radio on the Pi's UART.
+
+The remote sends ControlProtocol frames in packets: one or more
+frames and a CRC-16 (CCITT), COBS encoded so the packet has no zero
+bytes, then a zero to end it.  A packet lost or garbled on the radio
+fails its CRC and is dropped, and the next zero resynchronises.
+The device is read non-blocking, as much as has arrived at a time,
+and packets are split out of the buffer whole, never byte by byte.
+"""
+
+import os
+import select
+import termios
+import time
+from binascii import crc_hqx
+from threading import Event, Lock
+
+from TestCode.CommsController import CommsServer, CommsListener, CommsReceiver, MessageReceiver, CommsConnection
+from TestCode.ControlProtocol import FrameEncoder
+from TestCode.Trace import trace
+
+BAD_PACKET = trace.event("serial.bad", "size")
+
+READ_SIZE = 4096
+BAUDS = {9600: termios.B9600, 19200: termios.B19200, 38400: termios.B38400,
+         57600: termios.B57600, 115200: termios.B115200, 230400: termios.B230400}
+
+
+def cobsEncode(data):
+    """
+    COBS encode data (which then has no zero bytes).
+    """
+    out = bytearray()
+    for block in bytes(data).split(b"\0"):
+        while len(block) >= 254:  # full blocks have no zero after them
+            out.append(255)
+            out += block[:254]
+            block = block[254:]
+        out.append(len(block) + 1)
+        out += block
+    return bytes(out)
+
+
+def cobsDecode(data):
+    """
+    Decode COBS data (without its ending zero), ValueError if corrupt.
+    """
+    out = bytearray()
+    i = 0
+    end = len(data)
+    while i < end:
+        code = data[i]
+        if code == 0 or i + code > end + 1:
+            raise ValueError("bad COBS block")
+        out += data[i + 1:i + code]
+        i += code
+        if code < 255 and i < end:
+            out.append(0)
+    return bytes(out)
+
+
+def packet(frames):
+    """
+    The packet (ending zero and all) carrying frames, ControlProtocol bytes.
+    """
+    return cobsEncode(frames + crc_hqx(frames, 0xFFFF).to_bytes(2, "little")) + b"\0"
+
+
+class PacketParser():
+    '''
+    Splits packets out of serial data read in arbitrary sized pieces.
+
+    feed() returns the frames of each good packet completed by the data
+    given; packets counts the good ones, bad those dropped as corrupt.
+    '''
+
+    def __init__(self):
+        self._partial = b""
+        self.packets = 0
+        self.bad = 0
+        return
+
+    def feed(self, data):
+        pieces = (self._partial + data).split(b"\0")
+        self._partial = pieces.pop()  # not ended yet
+        good = []
+        for piece in pieces:
+            if not piece:
+                continue  # idle zeros between packets
+            try:
+                body = cobsDecode(piece)
+            except ValueError:
+                body = b""
+            if len(body) > 2 and crc_hqx(body[:-2], 0xFFFF) == int.from_bytes(body[-2:], "little"):
+                good.append(body[:-2])
+                self.packets += 1
+            else:
+                self.bad += 1
+                if trace.on:
+                    trace.record(BAD_PACKET, len(piece))
+        return good
+
+
+def openSerial(device, baud=57600):
+    """
+    Open device raw and non-blocking at baud, returns the file descriptor.
+    """
+    fd = os.open(device, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    attributes = termios.tcgetattr(fd)
+    attributes[0] = 0  # iflag - no translation or flow control
+    attributes[1] = 0  # oflag
+    attributes[2] = termios.CS8 | termios.CREAD | termios.CLOCAL
+    attributes[3] = 0  # lflag - not canonical, no echo
+    attributes[4] = attributes[5] = BAUDS[baud]
+    attributes[6][termios.VMIN] = 0
+    attributes[6][termios.VTIME] = 0
+    termios.tcsetattr(fd, termios.TCSANOW, attributes)
+    return fd
+
+
+class SerialConnection(CommsConnection):
+    '''
+    Describes a serial link: the device and its baud rate.
+    '''
+
+    def __init__(self, device="/dev/serial0", baud=57600):
+        self.device = device
+        self.baud = baud
+        return
+
+    def accept(self):
+        return self
+
+
+# no class SerialController()
+class SerialServer(CommsServer):
+    '''
+    This is a server for a serial link.
+
+    There is only one remote on the link, so the receiver gives up
+    its connection once and then waits until it is closed.
+    The setup is a SerialConnection.
+    '''
+
+    def makeReceiver(self):
+        return SerialReceiver(self.setup)
+
+    def makeListener(self, connection):
+        listener = None
+        if connection:
+            listener = SerialListener(connection, controller=self.controller)
+        return listener
+
+
+class SerialReceiver(CommsReceiver):
+
+    def setup(self, setup):
+        self.connection = setup
+        self.closed = Event()
+        return
+
+    def accept(self):
+        connection, self.connection = self.connection, None
+        if connection:
+            return connection
+        self.closed.wait()  # nothing more to accept
+        return None
+
+    def close(self):
+        self.closed.set()
+        return
+
+
+class SerialListener(CommsListener):
+    '''
+    Listener for a serial link, each message being the frames of
+    the packets read at once (which execute() decodes and performs).
+    '''
+
+    def makeReceiver(self, connection):
+        return SerialMessageReceiver(setup=connection)
+
+
+class SerialMessageReceiver(MessageReceiver):
+    '''
+    Reads packets from the device.  The device and the wake pipe
+    (which lets close() interrupt a read) are closed however reading
+    ends: closed, device gone or end of file.
+    '''
+
+    def setup(self, setup):
+        self.fd = openSerial(setup.device, setup.baud)
+        self.parser = PacketParser()
+        self.received = 0  # bytes
+        self._wake, self._woken = os.pipe()  # close() wakes select()
+        self._lock = Lock()
+        self._reading = False
+        self._closing = False
+        return
+
+    def getMessage(self):
+        # the frames of the packets read (None once closed)
+        with self._lock:
+            if self.fd is None:
+                return None  # already released
+            self._reading = True
+        message = None
+        try:
+            message = self._read()
+        finally:
+            with self._lock:
+                self._reading = False
+                closing = self._closing
+            if message is None or closing:
+                self._release()
+        return message
+
+    def _read(self):
+        while True:
+            ready = select.select([self.fd, self._wake], [], [])[0]
+            if self._wake in ready:
+                return None  # closed
+            data = []
+            while True:  # all that has arrived
+                try:
+                    chunk = os.read(self.fd, READ_SIZE)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    return None  # device gone
+                if not chunk:
+                    break
+                data.append(chunk)
+            if not data:
+                return None  # end of file
+            data = b"".join(data)
+            self.received += len(data)
+            frames = self.parser.feed(data)
+            if frames:
+                return b"".join(frames)
+
+    def _release(self):
+        # close the device and both ends of the wake pipe, just once
+        with self._lock:
+            for name in ("fd", "_wake", "_woken"):
+                fd = getattr(self, name)
+                if fd is not None:
+                    os.close(fd)
+                    setattr(self, name, None)
+        return
+
+    def stats(self):
+        return {"received": self.received, "packets": self.parser.packets, "bad": self.parser.bad}
+
+    def close(self):
+        with self._lock:
+            self._closing = True
+            if self._reading:
+                os.write(self._woken, b"x")  # getMessage() releases it all
+                return
+        self._release()
+        return
+
+
+class SerialSender():
+    '''
+    The remote's end of a serial link, for testing: writes frames as
+    packets to fd, at most as fast as baud would carry them if given
+    (a pseudo-terminal has no line speed of its own).
+    '''
+
+    def __init__(self, fd, baud=None):
+        self.fd = fd
+        self.baud = baud
+        self.encoder = FrameEncoder()
+        self.sent = 0  # bytes
+        self._due = None
+        return
+
+    def send(self, opcode, x=0.0, y=0.0):
+        data = packet(self.encoder.frame(opcode, x, y))
+        if self.baud:
+            now = time.perf_counter()
+            if self._due is None or self._due < now:
+                self._due = now
+            self._due += len(data) * 10.0 / self.baud  # start, 8 data and stop bits
+            while time.perf_counter() < self._due:
+                pass  # sleep() is far too coarse at these rates
+        os.write(self.fd, data)
+        self.sent += len(data)
+        return self._due
+
+
+if __name__ == '__main__':
+    # for testing, throughput and latency over a pseudo-terminal pair,
+    # latency being from the end of a packet on the line to the boat
+    import pty
+    import tty
+    from TestCode.CommsController import CommsController
+    from TestCode.ControlProtocol import PRESS, MOVE, LIFT
+
+    class TimingBoat():
+        def __init__(self):
+            self.times = []
+
+        def navigate(self, x, y):
+            self.times.append(time.perf_counter())
+
+    for baud in (57600, 115200):
+        master, slave = pty.openpty()
+        tty.setraw(slave)  # before anything is sent, as for a real UART
+        boat = TimingBoat()
+        controller = CommsController(server=SerialServer(SerialConnection(os.ttyname(slave), baud)), boat=boat)
+        while not controller.listeners:
+            time.sleep(0.01)
+        sender = SerialSender(master, baud)
+        count = 1000
+        start = time.perf_counter()
+        due = [sender.send(PRESS, 0.0, 0.1)]
+        for i in range(count):
+            due.append(sender.send(MOVE, i / count, 0.5))
+        due.append(sender.send(LIFT, 1.0, 0.5))
+        while len(boat.times) < len(due) and time.perf_counter() - start < 10:
+            time.sleep(0.01)
+        elapsed = boat.times[-1] - start
+        latencies = [(got - sent) * 1000 for got, sent in zip(boat.times, due)]
+        stats = controller.listeners[0].receiver.stats()
+        print(f"{baud} baud: {len(boat.times)} frames in {elapsed:.2f}s "
+              f"({len(boat.times) / elapsed:.0f}/s, {stats['received'] * 10 / elapsed:.0f} baud used), "
+              f"latency mean {sum(latencies) / len(latencies):.2f}ms worst {max(latencies):.2f}ms, "
+              f"bad packets {stats['bad']}")
+        controller.shutdown()
+        os.close(master)
+        os.close(slave)
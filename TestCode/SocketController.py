@@ -0,0 +1,323 @@
+# !/usr/bin/python3
+# SocketController - network controller
+"""
+An implementation of CommsController over TCP and UDP sockets.
+
+Each controller holds a TCP connection for its session: the server
+sends it a SESSION frame naming it, and the presses, lifts and
+doubles (which must not be lost) go over it.  The stream of moves
+goes as UDP datagrams to the same port, tagged with the session,
+where late or repeated ones are simply dropped - every frame from
+a controller is numbered, over either socket, so a move overtaken
+by a newer move (or a lift) is never acted on.  A press or lift
+over TCP that arrives after a newer move is still acted on, but at
+the newest position, so it can't take the boat back in time.
+All messages are ControlProtocol frames.
+"""
+
+import socket
+from threading import Thread, Lock
+
+from TestCode.CommsController import CommsServer, CommsListener, CommsReceiver, MessageReceiver
+from TestCode.ControlProtocol import (FRAME, FrameEncoder, FrameParser, decodeAll, encode, newer,
+                                      PRESS, MOVE, LIFT, DOUBLE, CLOSE, SESSION)
+from TestCode.Trace import trace
+
+STALE = trace.event("socket.stale", "session", "sequence", "last")
+
+DATAGRAM = FRAME.size * 64  # the most frames read from one datagram
+
+
+# no class SocketController()
+class SocketServer(CommsServer):
+    '''
+    This is a server for network controllers.
+
+    The setup is the (host, port) to listen on, for both TCP and UDP
+    (port 0 picks a free one, see address).
+    Up to 255 controllers can be connected at once.
+    '''
+
+    def __init__(self, setup=("", 5000)):
+        self.sessions = {}  # session -> SocketListener
+        self._sessionsLock = Lock()
+        CommsServer.__init__(self, setup)
+        self.address = self.receiver.address
+        self.datagrams = DatagramChannel(self.address, self.sessions)
+        return
+
+    def startup(self, serverId, controller):
+        self.datagrams.start()
+        return super().startup(serverId, controller)
+
+    def shutdown(self):
+        self.datagrams.close()
+        super().shutdown()
+        return
+
+    def makeReceiver(self):
+        return SocketReceiver(self.setup)
+
+    def makeListener(self, connection):
+        # make a SocketListener for the accepted socket, with a free session
+        listener = None
+        if connection:
+            with self._sessionsLock:
+                free = [session for session in range(1, 256) if session not in self.sessions]
+                if not free:
+                    connection[0].close()
+                    raise Exception("SocketServer has no free sessions")
+                listener = SocketListener(connection, controller=self.controller)
+                listener.session = free[0]
+                listener.sessions = self.sessions
+                self.sessions[free[0]] = listener
+        return listener
+
+
+class SocketReceiver(CommsReceiver):
+
+    def setup(self, setup):
+        self.socket = socket.create_server(setup)
+        self.address = self.socket.getsockname()[:2]
+        return
+
+    def accept(self):
+        try:
+            connection, peer = self.socket.accept()
+        except OSError:
+            return None  # closed
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return connection, peer
+
+    def close(self):
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)  # wakes accept()
+        except OSError:
+            pass
+        self.socket.close()
+        return
+
+
+class DatagramChannel(Thread):
+    '''
+    Receives the UDP datagrams for every session of a server,
+    passing each frame on to its session's listener.
+
+    Frames for unknown sessions, or from any host but the
+    session's own, are counted in unknown and ignored.
+    '''
+
+    def __init__(self, address, sessions):
+        Thread.__init__(self, daemon=True)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(address)
+        self.sessions = sessions
+        self.received = 0
+        self.unknown = 0
+        self.ok = False
+        return
+
+    def close(self):
+        self.ok = False
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)  # wakes recvfrom_into()
+        except OSError:
+            pass
+        self.socket.close()
+        return
+
+    def run(self):
+        self.ok = True
+        buffer = bytearray(DATAGRAM)
+        view = memoryview(buffer)
+        while self.ok:
+            try:
+                size, peer = self.socket.recvfrom_into(buffer)
+            except OSError:
+                break
+            for opcode, session, sequence, stamp, x, y in decodeAll(view[:size]):
+                self.received += 1
+                listener = self.sessions.get(session)
+                if listener and listener.peer[0] == peer[0]:
+                    listener.datagram(opcode, sequence, x, y)
+                else:
+                    self.unknown += 1
+        return
+
+
+class SocketListener(CommsListener):
+    '''
+    Listener for one network controller's session.
+
+    run() reads its TCP frames, which are always acted on (though
+    if not newer than any before, at the newest position, x and y),
+    the server's DatagramChannel passes on its UDP frames, which are
+    dropped (and counted in stale) unless newer than any before.
+    '''
+
+    def __init__(self, connection, controller=None):
+        self.session = 0
+        self.sessions = {}
+        self.peer = connection[1]
+        self.last = 0
+        self.x = self.y = 0.0  # position of the newest frame acted on
+        self.stale = 0
+        self._lock = Lock()  # frames come from both sockets
+        CommsListener.__init__(self, connection, controller=controller)
+        return
+
+    def makeReceiver(self, connection):
+        return StreamReceiver(setup=connection[0])
+
+    def startup(self, connectionId, controller):
+        if self.receiver and not self.is_alive():  # first time, name the session
+            self.receiver.send(encode(SESSION, self.session, 0, 0.0, 0.0))
+        return super().startup(connectionId, controller)
+
+    def shutdown(self):
+        if self.sessions.get(self.session) is self:
+            del self.sessions[self.session]
+        super().shutdown()
+        return
+
+    def execute(self, message):
+        for opcode, session, sequence, stamp, x, y in decodeAll(message):
+            with self._lock:
+                if newer(sequence, self.last):
+                    self.last = sequence
+                    self.x, self.y = x, y
+                # just the press or lift if older, not its position
+                self.perform(opcode, self.x, self.y)
+        return
+
+    def datagram(self, opcode, sequence, x, y):
+        with self._lock:
+            if not newer(sequence, self.last):
+                self.stale += 1
+                if trace.on:
+                    trace.record(STALE, self.session, sequence, self.last)
+                return
+            self.last = sequence
+            self.x, self.y = x, y
+            if self.ok:
+                self.perform(opcode, x, y)
+        return
+
+
+class StreamReceiver(MessageReceiver):
+
+    def setup(self, setup):
+        self.socket = setup
+        self.parser = FrameParser()
+        self._buffer = bytearray(FRAME.size * 256)
+        return
+
+    def getMessage(self):
+        # the whole frames read (None once closed)
+        view = memoryview(self._buffer)
+        while True:
+            try:
+                size = self.socket.recv_into(self._buffer)
+            except OSError:
+                return None  # closed
+            if not size:
+                return None
+            whole = self.parser.whole(view[:size])
+            if whole:
+                return whole
+
+    def send(self, data):
+        self.socket.sendall(data)
+        return
+
+    def close(self):
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)  # wakes recv_into()
+        except OSError:
+            pass
+        self.socket.close()
+        return
+
+
+class SocketClient():
+    '''
+    The controller's end of a session, for testing or a remote.
+
+    press(), lift(), double() and close() go over TCP, move() over
+    UDP; all are numbered from the one FrameEncoder.
+    '''
+
+    def __init__(self, address):
+        self.stream = socket.create_connection(address)
+        self.stream.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.datagrams = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.datagrams.connect(address)
+        parser = FrameParser()
+        frames = []
+        while not frames:
+            data = self.stream.recv(FRAME.size)
+            if not data:
+                raise Exception("SocketClient refused")
+            frames = decodeAll(parser.whole(data))
+        self.encoder = FrameEncoder(frames[0][1])  # the session
+        return
+
+    def press(self, x, y):
+        self.stream.sendall(self.encoder.frame(PRESS, x, y))
+        return
+
+    def move(self, x, y):
+        self.datagrams.send(self.encoder.frame(MOVE, x, y))
+        return
+
+    def lift(self, x, y):
+        self.stream.sendall(self.encoder.frame(LIFT, x, y))
+        return
+
+    def double(self, x, y):
+        self.stream.sendall(self.encoder.frame(DOUBLE, x, y))
+        return
+
+    def close(self):
+        try:
+            self.stream.sendall(self.encoder.frame(CLOSE))
+        except OSError:
+            pass
+        self.stream.close()
+        self.datagrams.close()
+        return
+
+
+if __name__ == '__main__':
+    # for testing, over loopback
+    import time
+    from TestCode.CommsController import CommsController
+
+    class CountingBoat():
+        def __init__(self):
+            self.moves = 0
+            self.position = None
+
+        def navigate(self, x, y):
+            self.moves += 1
+            self.position = (x, y)
+
+    boat = CountingBoat()
+    server = SocketServer(("127.0.0.1", 0))
+    controller = CommsController(server=server, boat=boat)
+    client = SocketClient(server.address)
+    start = time.perf_counter()
+    client.press(0.0, 0.1)
+    for i in range(10000):
+        client.move(i / 10000.0, 0.5)
+    client.lift(0.9, 0.5)
+    late = client.encoder.sequence - 1
+    client.datagrams.send(encode(MOVE, client.encoder.connection, late, 1.0, 1.0))  # overtaken
+    time.sleep(0.2)
+    listener = server.sessions[client.encoder.connection]
+    print(f"10000 moves sent in {time.perf_counter() - start:.2f}s,",
+          "received:", server.datagrams.received, "acted on:", boat.moves,
+          "stale:", listener.stale, "final position:", boat.position)
+    client.close()
+    time.sleep(0.1)
+    controller.shutdown()
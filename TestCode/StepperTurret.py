@@ -0,0 +1,382 @@
+# !/usr/bin/python3
+"""
+StepperTurret - the boat's turrets, turned by stepper motors
+The steppers (with ULN2003 style drivers) hang off an MCP23017
+I2C port expander, four coil pins each, so one expander drives
+up to four turrets.  A single background thread steps them all,
+accelerating and braking each one, and writes every coil change
+of a tick to each expander in one I2C transfer, so the control
+threads only ever set where a turret should be.
+"""
+
+import math
+import time
+from threading import Thread, Event
+
+from TestCode.Targeting import solve, targetingGrid
+
+# MCP23017 registers (IOCON.BANK = 0, so A and B are adjacent)
+IODIRA = 0x00
+OLATA = 0x14
+
+# coil patterns for half stepping, one bit per coil
+HALF_STEP = (0b0001, 0b0011, 0b0010, 0b0110, 0b0100, 0b1100, 0b1000, 0b1001)
+FULL_STEP = (0b0011, 0b0110, 0b1100, 0b1001)
+
+
+def openBus(number=1):
+    # the Pi's I2C bus (GPIO2 and 3 are bus 1)
+    from smbus2 import SMBus
+    return SMBus(number)
+
+
+class MockBus():
+    '''
+    Stands in for an SMBus, for testing without the hardware.
+
+    registers holds the last byte written to each (address, register),
+    transfers counts the I2C transactions.
+    '''
+
+    def __init__(self):
+        self.registers = {}
+        self.transfers = 0
+        return
+
+    def write_byte_data(self, address, register, value):
+        self.write_i2c_block_data(address, register, [value])
+        return
+
+    def write_i2c_block_data(self, address, register, data):
+        self.transfers += 1
+        for i, value in enumerate(data):
+            self.registers[(address, register + i)] = value & 0xFF
+        return
+
+    def read_byte_data(self, address, register):
+        self.transfers += 1
+        return self.registers.get((address, register), 0)
+
+    def close(self):
+        return
+
+
+class Expander():
+    '''
+    An MCP23017 with all 16 pins as outputs.
+
+    Pins are changed in a shadow copy (change()) and only sent
+    by flush(), both ports in one transfer, and only if they changed.
+    '''
+
+    def __init__(self, bus, address=0x20):
+        self.bus = bus
+        self.address = address
+        self.bus.write_i2c_block_data(address, IODIRA, [0x00, 0x00])  # all outputs
+        self.latch = 0
+        self._sent = None
+        self.writes = 0
+        self.flush()
+        return
+
+    def change(self, mask, bits):
+        self.latch = (self.latch & ~mask) | (bits & mask)
+        return
+
+    def flush(self):
+        latch = self.latch
+        if latch != self._sent:
+            self.bus.write_i2c_block_data(self.address, OLATA, [latch & 0xFF, latch >> 8])
+            self._sent = latch
+            self.writes += 1
+        return
+
+
+class LimitedStepper():
+    '''
+    A stepper motor that may only turn between two limits.
+
+    It has no end stops, so it is assumed to start at home
+    (the middle, unless told otherwise) and positions are
+    counted in steps from 0 to limit.
+    Its coils are the four expander pins from offset.
+    Moves are made by a :class:`StepScheduler`, at up to
+    maxSpeed steps a second, changing speed by up to
+    acceleration steps a second each second.
+    '''
+
+    def __init__(self, expander, offset=0, limit=40, home=None,
+                 maxSpeed=100.0, acceleration=400.0, sequence=HALF_STEP):
+        self.expander = expander
+        self.limit = limit
+        self.maxSpeed = maxSpeed
+        self.acceleration = acceleration
+        self.sequence = sequence
+        self._shift = offset
+        self._mask = 0xF << offset
+        self.position = limit // 2 if home is None else home
+        self.target = self.position
+        self.speed = 0.0  # steps a second, signed
+        self._fraction = 0.0  # of a step, towards the next
+        self.scheduler = None
+        self._coils()
+        return
+
+    @property
+    def value(self):
+        """
+        The position from -1 (at 0) to 1 (at limit).
+        """
+        return 2.0 * self.position / self.limit - 1.0
+
+    @value.setter
+    def value(self, value):
+        self.moveTo(round((value + 1.0) * self.limit / 2.0))
+        return
+
+    def moveTo(self, position):
+        # set where to go, the scheduler does the rest
+        self.target = max(0, min(self.limit, position))
+        if self.scheduler:
+            self.scheduler.wake()
+        return
+
+    def mid(self):
+        self.moveTo(self.limit // 2)
+        return
+
+    @property
+    def moving(self):
+        return self.position != self.target or self.speed != 0.0
+
+    def release(self):
+        # coils off, saves power but the turret may then be pushed round
+        self.expander.change(self._mask, 0)
+        return
+
+    def _coils(self):
+        bits = self.sequence[self.position % len(self.sequence)]
+        self.expander.change(self._mask, bits << self._shift)
+        return
+
+    def advance(self, dt):
+        """
+        Move on by dt seconds, returns the steps taken (-1, 0 or 1).
+        """
+        distance = self.target - self.position
+        # the fastest that can still stop in time, towards the target
+        brake = math.sqrt(2.0 * self.acceleration * abs(distance))
+        want = math.copysign(min(self.maxSpeed, brake), distance) if distance else 0.0
+        change = self.acceleration * dt
+        speed = max(self.speed - change, min(self.speed + change, want))
+        self.speed = speed
+        self._fraction += speed * dt
+        step = 0
+        if self._fraction >= 1.0:
+            self._fraction -= 1.0
+            step = 1
+        elif self._fraction <= -1.0:
+            self._fraction += 1.0
+            step = -1
+        if step * distance <= 0 and step:
+            step = 0  # never step past the target
+            self._fraction = 0.0
+        if step:
+            self.position += step
+            self._coils()
+        if self.position == self.target and abs(self.speed) <= change:
+            self.speed = 0.0
+            self._fraction = 0.0
+        return step
+
+
+class StepScheduler(Thread):
+    '''
+    Steps any number of steppers at once, rate ticks a second.
+
+    Each tick every moving stepper advances (at most a step)
+    and then each expander is written once, so turrets on the
+    same expander move together in one I2C transfer.
+    When nothing is moving the thread sleeps until a stepper
+    is given somewhere to go.
+    '''
+
+    def __init__(self, steppers, rate=500.0):
+        Thread.__init__(self, daemon=True)
+        self.steppers = tuple(steppers)
+        self.expanders = []
+        for stepper in self.steppers:
+            if stepper.maxSpeed > rate:
+                raise ValueError('maxSpeed must be no more than one step a tick')
+            stepper.scheduler = self
+            if stepper.expander not in self.expanders:
+                self.expanders.append(stepper.expander)
+        self.rate = rate
+        self._wake = Event()
+        self.ticks = 0
+        self.overruns = 0
+        self.steps = 0
+        self.ok = False
+        for expander in self.expanders:
+            expander.flush()
+        return
+
+    def wake(self):
+        self._wake.set()
+        return
+
+    def moving(self):
+        for stepper in self.steppers:
+            if stepper.moving:
+                return True
+        return False
+
+    def stats(self):
+        return {"ticks": self.ticks, "overruns": self.overruns, "steps": self.steps,
+                "writes": sum(expander.writes for expander in self.expanders)}
+
+    def shutdown(self):
+        self.ok = False
+        self._wake.set()
+        return
+
+    def run(self):
+        self.ok = True
+        interval = 1.0 / self.rate
+        start = time.monotonic()
+        tick = 0
+        while self.ok:
+            if not self.moving():
+                self._wake.clear()
+                if not self.moving():  # in case one was set going meanwhile
+                    self._wake.wait()
+                start = time.monotonic()
+                tick = 0
+                continue
+            tick += 1
+            due = start + tick * interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            late = time.monotonic() - due
+            if late > interval:  # skip what can no longer be on time
+                missed = int(late / interval)
+                self.overruns += missed
+                tick += missed
+            self.ticks += 1
+            self.step(interval)
+        return
+
+    def step(self, dt):
+        for stepper in self.steppers:
+            if stepper.moving:
+                if stepper.advance(dt):
+                    self.steps += 1
+        for expander in self.expanders:
+            expander.flush()
+        return
+
+
+class Turret():
+    '''
+    One turret: a pan stepper and (optionally) an elevation stepper,
+    facing facing (a fraction of the circle clockwise from ahead)
+    and turning through arc of it.
+
+    aim() solves the stick position to steps with solve(), or with
+    grid, with the :class:`TargetingGrid` shared by turrets of the
+    same geometry.  For this geometry solving is both quicker and
+    exact, so the grid is only worth it for geometries that are
+    expensive to solve.
+    '''
+
+    def __init__(self, pan, elevation=None, facing=0.0, arc=0.5, elevationArc=0.25, grid=False):
+        self.pan = pan
+        self.elevation = elevation
+        self.geometry = dict(panLimit=pan.limit, arc=arc, facing=facing,
+                             elevationLimit=elevation.limit if elevation else 1,
+                             elevationArc=elevationArc)
+        self.grid = targetingGrid(**self.geometry) if grid else None
+        return
+
+    @property
+    def steppers(self):
+        return (self.pan, self.elevation) if self.elevation else (self.pan,)
+
+    def aim(self, x, y):
+        if self.grid:
+            pan, elevation = self.grid.lookup(x, y)
+        else:
+            pan, elevation = solve(x, y, **self.geometry)
+        self.pan.moveTo(round(pan))
+        if self.elevation:
+            self.elevation.moveTo(round(elevation))
+        return
+
+
+class Turrets():
+    '''
+    The boat's turrets (back, middle and front), aimed by the
+    targeting connections, each one a :class:`Turret`.
+
+    aim() is safe to call from any number of connection threads
+    at once, it only solves for the targets and sets them.
+    '''
+
+    def __init__(self, turrets, rate=500.0):
+        self.turrets = tuple(turrets)
+        self.steppers = tuple(stepper for turret in self.turrets for stepper in turret.steppers)
+        self.scheduler = StepScheduler(self.steppers, rate=rate)
+        self.scheduler.start()
+        return
+
+    @classmethod
+    def onExpander(cls, bus=None, address=0x20, count=3, limit=40, elevation=False,
+                   facings=(0.5, 0.0, 0.0), arc=0.5, grid=False, **options):
+        """
+        count turrets with their pan steppers on one expander, at
+        pins 0-3, 4-7 and so on, and with elevation their elevation
+        steppers the same on a second expander at the next address.
+        The bus defaults to the Pi's I2C bus.
+        facings are the turrets' facings in order, any turrets
+        beyond them face ahead (0.0).
+        grid is passed on to each :class:`Turret`.
+        """
+        facings = tuple(facings) + (0.0,) * (count - len(facings))
+        bus = bus if bus is not None else openBus()
+        pans = Expander(bus, address)
+        lifts = Expander(bus, address + 1) if elevation else None
+        turrets = []
+        for i in range(count):
+            turrets.append(Turret(
+                LimitedStepper(pans, offset=4 * i, limit=limit, **options),
+                LimitedStepper(lifts, offset=4 * i, limit=limit, home=0, **options) if lifts else None,
+                facing=facings[i], arc=arc, grid=grid))
+        return cls(turrets)
+
+    def aim(self, turret, x, y):
+        if 0 <= turret < len(self.turrets):
+            self.turrets[turret].aim(x, y)
+        return
+
+    def positions(self):
+        # pans, then any elevations
+        return [turret.pan.position for turret in self.turrets] + \
+            [turret.elevation.position for turret in self.turrets if turret.elevation]
+
+    def shutdown(self):
+        self.scheduler.shutdown()
+        self.scheduler.join()
+        return
+
+
+if __name__ == '__main__':
+    # for testing, all three turrets swinging together on a mock bus
+    bus = MockBus()
+    turrets = Turrets.onExpander(bus, elevation=True)
+    for x, y in ((-1.0, 0.0), (1.0, 0.0), (0.0, 1.0), (0.0, -0.5)):
+        for turret in range(3):
+            turrets.aim(turret, x, y)
+        time.sleep(1.0)
+        print(turrets.positions(), turrets.scheduler.stats(), "transfers:", bus.transfers)
+    turrets.shutdown()
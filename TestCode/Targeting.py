@@ -0,0 +1,132 @@
+# !/usr/bin/python3
+"""
+Targeting - turning a targeting connection's (x, y) into turret steps
+The stick is read as a bearing and a range (see xy2ra()), the
+bearing turns the turret (pan) and the range sets the elevation
+for a simple ballistic shot.  Solving that takes trig on every
+move, so it can instead be done once over a grid of stick positions,
+shared by every turret with the same geometry, and moves looked up.
+For the geometry here solving is quicker (on CPython) and exact,
+so turrets only use the grid when asked to.
+"""
+
+import math
+from array import array
+from functools import lru_cache
+
+from TestCode.CommsController import xy2ra
+
+DEAD_ZONE = 0.1  # as xy2ra(), closer to the center than this has no bearing
+
+
+def solve(x, y, panLimit=40, arc=0.5, facing=0.0, elevationLimit=40, elevationArc=0.25):
+    """
+    Returns (pan, elevation) steps for the stick at (x, y).
+
+    The turret faces facing (a fraction of the whole circle, clockwise
+    from ahead) when its pan is at the middle of 0 to panLimit, and can
+    turn arc of the circle in all.  Bearings outside that are capped.
+    Elevation 0 to elevationLimit steps covers elevationArc of the circle
+    (a quarter being straight up) and full stick is the longest shot
+    (at 45 degrees, so range = sin(2 * elevation)).
+    In the dead zone the turret faces its own way, level.
+    """
+    r, a = xy2ra(x, y)
+    if r <= DEAD_ZONE:
+        return panLimit / 2.0, 0.0
+    offset = (a - facing + 0.5) % 1.0 - 0.5  # -0.5 (left) to 0.5 (right)
+    pan = panLimit / 2.0 + offset / arc * panLimit
+    pan = max(0.0, min(float(panLimit), pan))
+    lift = 0.5 * math.asin(r) / (2 * math.pi)  # fraction of the circle
+    elevation = min(float(elevationLimit), lift / elevationArc * elevationLimit)
+    return pan, elevation
+
+
+class TargetingGrid():
+    '''
+    solve() precomputed over a grid of stick positions.
+
+    resolution is the number of points across each axis (from -1 to 1),
+    lookups are bilinear between the four nearest points.  Where the
+    pan swings from one limit to the other between them (behind the
+    turret) that would swing it through the middle, so those few
+    cells are solved exactly instead.
+    '''
+
+    def __init__(self, resolution=41, **geometry):
+        self.resolution = resolution
+        self.geometry = geometry
+        self._half = max(resolution // 2, 1)
+        self._n = 2 * self._half + 1
+        self._swing = geometry.get("panLimit", 40) / 2.0
+        self.pans = array('d')
+        self.elevations = array('d')
+        half = self._half
+        for j in range(self._n):
+            y = -1.0 + j / half
+            for i in range(self._n):
+                pan, elevation = solve(-1.0 + i / half, y, **geometry)
+                self.pans.append(pan)
+                self.elevations.append(elevation)
+        return
+
+    def lookup(self, x, y):
+        """
+        Returns (pan, elevation) steps for the stick at (x, y).
+        """
+        half = self._half
+        n = self._n
+        gx = (min(max(x, -1.0), 1.0) + 1.0) * half
+        gy = (min(max(y, -1.0), 1.0) + 1.0) * half
+        i = min(int(gx), n - 2)
+        j = min(int(gy), n - 2)
+        fx = gx - i
+        fy = gy - j
+        a = j * n + i  # the four corners
+        b = a + 1
+        c = a + n
+        d = c + 1
+        pans = self.pans
+        elevations = self.elevations
+        pa, pb, pc, pd = pans[a], pans[b], pans[c], pans[d]
+        if max(pa, pb, pc, pd) - min(pa, pb, pc, pd) > self._swing:
+            return solve(x, y, **self.geometry)
+        w00 = (1.0 - fx) * (1.0 - fy)
+        w10 = fx * (1.0 - fy)
+        w01 = (1.0 - fx) * fy
+        w11 = fx * fy
+        return (pa * w00 + pb * w10 + pc * w01 + pd * w11,
+                elevations[a] * w00 + elevations[b] * w10 +
+                elevations[c] * w01 + elevations[d] * w11)
+
+
+@lru_cache(maxsize=None)
+def _grid(resolution, geometry):
+    return TargetingGrid(resolution, **dict(geometry))
+
+
+def targetingGrid(resolution=41, **geometry):
+    """
+    The TargetingGrid for this geometry, built once and then shared.
+    """
+    return _grid(resolution, tuple(sorted(geometry.items())))
+
+
+if __name__ == '__main__':
+    # for testing, compare the grid with solving every time
+    import random
+    import time
+    grid = targetingGrid(facing=0.5)
+    points = [(random.uniform(-1, 1), random.uniform(-1, 1)) for i in range(100000)]
+    worst = 0.0
+    for x, y in points:
+        pan, elevation = solve(x, y, facing=0.5)
+        lpan, lelevation = grid.lookup(x, y)
+        if math.hypot(x, y) > 2 * DEAD_ZONE:
+            worst = max(worst, abs(pan - lpan), abs(elevation - lelevation))
+    print("worst error (steps):", round(worst, 3))
+    for f in (lambda x, y: solve(x, y, facing=0.5), grid.lookup):
+        start = time.perf_counter()
+        for x, y in points:
+            f(x, y)
+        print(f"{(time.perf_counter() - start) / len(points) * 1e6:.2f}us a move")
@@ -0,0 +1,206 @@
+# !/usr/bin/python3
+"""
+Trace - a low overhead record of what the boat is doing
+Printing from the control paths is far too slow to leave in, so
+instead events are recorded as numbers into a ring buffer made
+once at the start, and a background thread writes them out, as
+text or binary, every so often.
+Call sites check trace.on first, so tracing that is off costs
+one attribute test:
+
+    if trace.on:
+        trace.record(NAVIGATE, x, y)
+"""
+
+import struct
+import sys
+import time
+from array import array
+from itertools import count
+from threading import Thread, Event
+
+FIELDS = 6  # values per record
+RECORD = 3 + FIELDS  # sequence, time, event, fields
+MAGIC = b"TRCE"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")  # magic, version, fields, names size
+
+
+class Tracer():
+    '''
+    Records events into a ring of size records.
+
+    Events are registered by event(name, *fields), which returns the
+    code to record them with (do it on import, so binary traces started
+    later name them all).  record() stores the time and up to six
+    numbers; nothing is allocated or formatted there.
+    If the writer falls behind by a whole ring the oldest records are
+    lost and counted in dropped.
+    '''
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.on = False
+        self.names = []
+        self.fields = []
+        self.dropped = 0
+        self.written = 0
+        self._ring = array('d', bytes(8 * RECORD * size))
+        self._count = count()
+        self._next = 0  # the next sequence number to write out
+        self._sink = None
+        self._text = True
+        self._writer = None
+        self._stopping = Event()
+        return
+
+    def event(self, name, *fields):
+        """
+        Register an event with up to six named fields, returns its code.
+        """
+        if len(fields) > FIELDS:
+            raise ValueError(f"at most {FIELDS} fields")
+        if name in self.names:
+            return self.names.index(name)
+        self.names.append(name)
+        self.fields.append(fields)
+        return len(self.names) - 1
+
+    def record(self, code, a=0.0, b=0.0, c=0.0, d=0.0, e=0.0, f=0.0):
+        sequence = next(self._count)  # atomic, so safe from any thread
+        ring = self._ring
+        i = (sequence % self.size) * RECORD
+        ring[i + 3] = a
+        ring[i + 4] = b
+        ring[i + 5] = c
+        ring[i + 6] = d
+        ring[i + 7] = e
+        ring[i + 8] = f
+        ring[i + 1] = time.monotonic()
+        ring[i + 2] = code
+        ring[i] = sequence + 1  # last, marks the record complete (0 is never written)
+        return
+
+    def start(self, sink=None, text=True, interval=0.5):
+        """
+        Start recording, writing out every interval seconds to sink
+        (a file, by default stdout) as lines of text or binary records
+        (a binary file, by default stdout's underlying buffer).
+        """
+        if self._writer:
+            self.stop()
+        if sink is None:
+            sink = sys.stdout if text else sys.stdout.buffer
+        self._sink = sink
+        self._text = text
+        if not text:
+            self._header()
+        self._stopping.clear()
+        self._writer = Thread(target=self._run, args=(interval,), daemon=True)
+        self._writer.start()
+        self.on = True
+        return
+
+    def stop(self):
+        """
+        Stop recording and write out what is left.
+        """
+        self.on = False
+        if self._writer:
+            self._stopping.set()
+            self._writer.join()
+            self._writer = None
+        return
+
+    def _run(self, interval):
+        while not self._stopping.wait(interval):
+            self.flush()
+        self.flush()
+        return
+
+    def _header(self):
+        names = "\n".join(",".join((name,) + fields)
+                          for name, fields in zip(self.names, self.fields)).encode("utf-8")
+        self._sink.write(HEADER.pack(MAGIC, VERSION, FIELDS, len(names)) + names)
+        return
+
+    def flush(self):
+        """
+        Write out the complete records not yet written.
+        """
+        ring = self._ring
+        size = self.size
+        sequence = self._next
+        records = []
+        while True:
+            i = (sequence % size) * RECORD
+            found = int(ring[i]) - 1
+            if found < sequence:
+                break  # not written yet (or still being written)
+            if found > sequence:
+                # lapped, the oldest left is a ring behind the newest
+                newest = max(int(ring[j]) for j in range(0, size * RECORD, RECORD)) - 1
+                oldest = newest - size + 1
+                self.dropped += oldest - sequence
+                sequence = oldest
+                continue
+            records.append(ring[i:i + RECORD])
+            sequence += 1
+        self._next = sequence
+        if not records or not self._sink:
+            return
+        if self._text:
+            self._sink.write("".join(map(self.format, records)))
+        else:
+            self._sink.write(b"".join(record.tobytes() for record in records))
+        self._sink.flush()
+        self.written += len(records)
+        return
+
+    def format(self, record):
+        code = int(record[2])
+        fields = self.fields[code]
+        values = "".join(f" {name}={value:g}" for name, value in zip(fields, record[3:]))
+        return f"{record[1]:.6f} {self.names[code]}{values}\n"
+
+    def stats(self):
+        return {"written": self.written, "dropped": self.dropped}
+
+
+def readTrace(path):
+    """
+    Read a binary trace, yielding (time, event name, {field: value}).
+    """
+    with open(path, "rb") as fd:
+        data = fd.read()
+    magic, version, fields, size = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} trace")
+    offset = HEADER.size
+    events = [line.split(",") for line in data[offset:offset + size].decode("utf-8").split("\n")]
+    records = array('d')
+    records.frombytes(data[offset + size:])
+    width = 3 + fields
+    for i in range(0, len(records), width):
+        event = events[int(records[i + 2])]
+        yield records[i + 1], event[0], dict(zip(event[1:], records[i + 3:i + width]))
+
+
+# the boat's tracer, shared by everything
+trace = Tracer()
+
+
+if __name__ == '__main__':
+    # for testing, the cost of a record on and off
+    TEST = trace.event("test", "a", "b")
+    for on in (False, True):
+        if on:
+            trace.start(open("/dev/null", "w"))
+        start = time.perf_counter()
+        for i in range(100000):
+            if trace.on:
+                trace.record(TEST, i, 2.0)
+        print(f"tracing {'on' if on else 'off'}: "
+              f"{(time.perf_counter() - start) / 100000 * 1e9:.0f}ns a record")
+    trace.stop()
+    print(trace.stats())
@@ -9,10 +9,13 @@ Details are listed below.
 """
 
 
+import os
+
 from TestCode.BdController import BdServer
+from TestCode.Calibration import TrimProfile, DEFAULT_PATH
 from TestCode.ControlledBoat import ControlledBoat
 from TestCode.DisplayBoat import DisplayBoat
-from TestCode.GpioZeroBoat import GPIOZeroBoat
+from TestCode.PinPlanner import planBoat
 
 '''
     The raspberry pi pins (taken from outout from pinout with added *'s) are:
@@ -45,6 +48,8 @@ from TestCode.GpioZeroBoat import GPIOZeroBoat
     and
     * hardware PWM is on pins:
     GPIO12, GPIO13, GPIO18, GPIO19
+    but there are only two channels, GPIO12 and GPIO18 share one,
+    GPIO13 and GPIO19 the other, so only two outputs can have it.
 
     Suggest use:
     GPIO14, GPIO15, GPIO18*
@@ -54,6 +59,15 @@ from TestCode.GpioZeroBoat import GPIOZeroBoat
     and GPIO12* for the servo for the ruder
     So you can make use of the hardware PWM
     and have each motor use 3 pins close to each other
+
+    PinPlanner works this out: planBoat() reports which outputs
+    get the hardware channels, which are left on software PWM
+    (and roughly the CPU that costs), and any clashes with I2C
+    (or the HAT EEPROM pins, GPIO0 and GPIO1, if a HAT is fitted
+    and reserved=RESERVED + HAT_EEPROM is given).
+    Note gpiozero's Motor PWMs the forward and backward pins and
+    just holds the enable pin high, so an enable on a hardware
+    PWM pin gains nothing.
 '''
 
 
@@ -67,9 +81,13 @@ if __name__ == '__main__':
     servo = 13 # only other pin being used for testing
 
     print("Virtual Boat about to start")
+    plan = planBoat(left, right, center, servo)
+    print(plan.report())
     # create and also start the boat:
     # old version: boat = BlueDotBoat(left, right, center, servo)
-    boat = GPIOZeroBoat(left, right, center, servo)
+    boat = plan.boat()
+    if os.path.exists(DEFAULT_PATH):  # trim from an earlier calibration
+        boat.calibrationOn(TrimProfile.load(DEFAULT_PATH))
     # GPIOZeroBoat is just the boat with no controller ...
 
     # add a blue dot controller, that knows about double clicking to swap function
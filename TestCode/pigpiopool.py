@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+# Share PiGPIO daemon connections between readers
+
+from threading import Lock
+
+import pigpio
+
+
+class PiPool:
+    """
+    Hands out shared, reference counted, pigpio.pi connections.
+
+    Each (host, port) gets one connection (so one socket and one
+    callback thread) however many readers use it.  The connection
+    is stopped when the last user releases it.
+
+    Optionally a factory may be given to make connections,
+    it defaults to pigpio.pi and may be FakePi for testing.
+    """
+
+    def __init__(self, factory=None):
+        if factory is None:
+            factory = pigpio.pi
+        self.factory = factory
+        self._lock = Lock()
+        self._shared = {}  # (host, port) -> [pi, users]
+        return
+
+    def acquire(self, host=None, port=None):
+        """
+        Returns the shared connection for host and port,
+        making it if needed.
+        """
+        key = (host, port)
+        with self._lock:
+            entry = self._shared.get(key)
+            if entry is None:
+                kwargs = {}
+                if host is not None:
+                    kwargs["host"] = host
+                if port is not None:
+                    kwargs["port"] = port
+                entry = [self.factory(**kwargs), 0]
+                self._shared[key] = entry
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, pi):
+        """
+        Give up a connection, stopping it if no one else uses it.
+        """
+        with self._lock:
+            for key, entry in self._shared.items():
+                if entry[0] is pi:
+                    entry[1] -= 1
+                    if entry[1] <= 0:
+                        del self._shared[key]
+                        pi.stop()
+                    return
+        return
+
+    def users(self, pi):
+        """
+        Returns how many users a connection has.
+        """
+        with self._lock:
+            for entry in self._shared.values():
+                if entry[0] is pi:
+                    return entry[1]
+        return 0
+
+
+pool = PiPool()  # the process wide pool
+
+
+class FakeCallback:
+
+    def __init__(self, pi, gpio, edge, func):
+        self.pi = pi
+        self.gpio = gpio
+        self.edge = edge
+        self.func = func
+        return
+
+    def cancel(self):
+        if self in self.pi.callbacks:
+            self.pi.callbacks.remove(self)
+        return
+
+
+class FakePi:
+    """
+    A stand in for a pigpio daemon connection.
+
+    It remembers modes and callbacks and edge() plays an edge
+    to the matching callbacks, as the daemon's notification
+    thread would.
+    """
+
+    def __init__(self, host=None, port=None):
+        self.host = host
+        self.port = port
+        self.connected = True
+        self.modes = {}
+        self.callbacks = []
+        return
+
+    def set_mode(self, gpio, mode):
+        self.modes[gpio] = mode
+        return 0
+
+    def callback(self, user_gpio, edge=pigpio.RISING_EDGE, func=None):
+        cb = FakeCallback(self, user_gpio, edge, func)
+        self.callbacks.append(cb)
+        return cb
+
+    def edge(self, gpio, level, tick):
+        for cb in list(self.callbacks):
+            if cb.gpio != gpio:
+                continue
+            if cb.edge == pigpio.EITHER_EDGE or \
+                    (cb.edge == pigpio.RISING_EDGE and level == 1) or \
+                    (cb.edge == pigpio.FALLING_EDGE and level == 0):
+                cb.func(gpio, level, tick & 0xffffffff)
+        return
+
+    def stop(self):
+        self.connected = False
+        self.callbacks = []
+        return
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# Compare PWM reader captures against the WavePWM reference
+
+import math
+import os
+import statistics
+
+from TestCode.pwmrecord import Recording
+
+PERIOD = 30.0  # seconds for one WavePWM cycle
+MID = 50.0  # WavePWM duty cycle (%) at 0
+SWING = 25.0  # WavePWM duty cycle (%) change at +/-1
+CHANNELS = (("rudder", "rf", "rpw", "rdc", math.cos),
+            ("motor", "mf", "mpw", "mdc", math.sin))
+
+
+def load(name):
+    """
+    Load a capture as a dictionary of column name to list of values.
+
+    name + '.pwm' (a binary recording) is used if there is one,
+    otherwise name + '.txt' (CSV with a heading line).
+    """
+    if os.path.exists(name + '.pwm'):
+        with Recording(name + '.pwm') as recording:
+            return {column: recording.column(column).tolist()
+                    for column in recording.names}
+    with open(name + '.txt') as fd:
+        names = [column.strip() for column in fd.readline().split(",")]
+        rows = [[float(value) for value in line.split(",")]
+                for line in fd if line.strip()]
+    return {column: [row[i] for row in rows] for i, column in enumerate(names)}
+
+
+def percentile(ordered, fraction):
+    """
+    Returns the value a fraction of the way through sorted values.
+    """
+    if not ordered:
+        return 0.0
+    position = fraction * (len(ordered) - 1)
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def histogram(values, width):
+    """
+    Returns a sorted list of (bin start, count) for bins of width.
+    """
+    counts = {}
+    for value in values:
+        start = math.floor(value / width) * width
+        counts[start] = counts.get(start, 0) + 1
+    return sorted(counts.items())
+
+
+def phase(times, duties, wave=math.cos):
+    """
+    Returns the phase (radians) that best lines up the reference
+    wave with the measured duty cycles (a least squares fit).
+    """
+    omega = 2 * math.pi / PERIOD
+    a = b = 0.0
+    for t, duty in zip(times, duties):
+        a += (duty - MID) * math.cos(omega * t)
+        b += (duty - MID) * math.sin(omega * t)
+    if wave is math.sin:
+        return math.atan2(a, b)
+    return math.atan2(-b, a)
+
+
+def dropped(capture):
+    """
+    Returns the number of missed samples, from the gaps in the
+    seq column (see testpwm).
+
+    Captures made before seq was recorded were all sampled at a
+    fixed interval, so for those it is judged from gaps longer
+    than one and a half normal sample intervals.
+    """
+    seqs = capture.get("seq")
+    if seqs is not None:
+        return int(sum(later - earlier - 1
+                       for earlier, later in zip(seqs, seqs[1:]) if later - earlier > 1))
+    times = capture["time"]
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    if not gaps:
+        return 0
+    normal = statistics.median(gaps)
+    if normal <= 0:
+        return 0
+    return sum(int(round(gap / normal)) - 1 for gap in gaps if gap > 1.5 * normal)
+
+
+def analyse(capture, name=""):
+    """
+    Returns a list of per channel result dictionaries for a capture.
+    """
+    times = capture["time"]
+    start = times[0] if times else 0.0
+    relative = [t - start for t in times]
+    shift = phase(relative, capture["rdc"])  # both waves share a start
+    omega = 2 * math.pi / PERIOD
+    results = []
+    for channel, f, pw, dc, wave in CHANNELS:
+        freqs = [value for value in capture[f] if value > 0]
+        empty = len(capture[f]) - len(freqs)
+        mean = statistics.fmean(freqs) if freqs else 0.0
+        spread = statistics.pstdev(freqs) if len(freqs) > 1 else 0.0
+        # difference from the reference, as duty and as pulse width
+        errors = [duty - (MID + SWING * wave(omega * t + shift))
+                  for t, duty in zip(relative, capture[dc])]
+        period = 1000000.0 / mean if mean else 0.0
+        widths = [error * period / 100.0 for error in errors]
+        ordered = sorted(abs(width) for width in widths)
+        rms = math.sqrt(statistics.fmean([e * e for e in errors])) if errors else 0.0
+        results.append({
+            "name": name,
+            "channel": channel,
+            "samples": len(times),
+            "dropped": dropped(capture),
+            "empty": empty,
+            "frequency": mean,
+            "stability": 100.0 * spread / mean if mean else 0.0,
+            "jitter": statistics.pstdev(widths) if len(widths) > 1 else 0.0,
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "p99": percentile(ordered, 0.99),
+            "max": ordered[-1] if ordered else 0.0,
+            "rms": rms,
+            "histogram": histogram(widths, 10.0),
+        })
+    return results
+
+
+def report(names=("pigpio-test", "gpiozero-test"), histograms=False):
+    """
+    Returns a summary table (as text) comparing the captures.
+    """
+    lines = []
+    heading = ("capture", "channel", "samples", "dropped", "empty", "freq Hz",
+               "freq sd%", "pw sd us", "p50 us", "p95 us", "p99 us", "max us", "rms dc%")
+    lines.append(f"{heading[0]:>15}" + "".join(f"{h:>10}" for h in heading[1:]))
+    found = []
+    for name in names:
+        try:
+            results = analyse(load(name), name)
+        except (OSError, KeyError) as e:
+            lines.append(f"{name:>15}  not loaded: {e}")
+            continue
+        found += results
+        for r in results:
+            lines.append(
+                f"{r['name']:>15}{r['channel']:>10}{r['samples']:>10}{r['dropped']:>10}"
+                f"{r['empty']:>10}{r['frequency']:>10.2f}{r['stability']:>10.3f}"
+                f"{r['jitter']:>10.1f}{r['p50']:>10.1f}{r['p95']:>10.1f}"
+                f"{r['p99']:>10.1f}{r['max']:>10.1f}{r['rms']:>10.3f}")
+    if histograms:
+        for r in found:
+            lines.append("")
+            lines.append(f"{r['name']} {r['channel']} pulse width error (us):")
+            for start, count in r["histogram"]:
+                lines.append(f"{start:>10.0f} {count:>6} " + "#" * min(count, 60))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(report(histograms=True))
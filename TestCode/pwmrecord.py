@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# Record PWM test samples as fixed width binary
+
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b"PWMR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")  # magic, version, columns, names size
+ALIGN = 8  # records start on a multiple of this
+
+
+class Recorder:
+    """
+    Writes samples to a file as they arrive.
+
+    The file is a small header (magic, version, column names)
+    then one record per sample of little endian doubles, one per
+    column, so nothing needs to be kept in memory or formatted.
+    """
+
+    def __init__(self, path, names):
+        self.path = path
+        self.names = tuple(names)
+        self._record = struct.Struct("<%dd" % len(self.names))
+        text = ",".join(self.names).encode("utf-8")
+        size = HEADER.size + len(text)
+        pad = -size % ALIGN
+        self._fd = open(path, "wb")
+        self._fd.write(HEADER.pack(MAGIC, VERSION, len(self.names), len(text) + pad))
+        self._fd.write(text + b"\0" * pad)
+        self.count = 0
+        return
+
+    def write(self, *values):
+        """
+        Write one sample, one value per column.
+        """
+        self._fd.write(self._record.pack(*values))
+        self.count += 1
+        return
+
+    def flush(self):
+        self._fd.flush()
+        return
+
+    def close(self):
+        if self._fd:
+            self._fd.close()
+            self._fd = None
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class Recording:
+    """
+    A recording made by Recorder, memory mapped rather than read.
+
+    column(name) gives a column as an array of doubles and
+    arrays() gives the whole file as a NumPy (samples x columns)
+    array without copying, if NumPy is installed.
+    A partly written last record is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = open(path, "rb")
+        self._map = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, columns, size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a PWM recording")
+        text = self._map[HEADER.size:HEADER.size + size].rstrip(b"\0")
+        self.names = tuple(text.decode("utf-8").split(","))
+        self.columns = columns
+        self._offset = HEADER.size + size
+        width = 8 * columns
+        self.count = (len(self._map) - self._offset) // width
+        self._view = memoryview(self._map)[
+            self._offset:self._offset + self.count * width].cast("d")
+        return
+
+    def __len__(self):
+        return self.count
+
+    def column(self, name):
+        """
+        Returns a column (by name or number) as an array of doubles.
+        """
+        if not isinstance(name, int):
+            name = self.names.index(name)
+        values = array("d")
+        values.frombytes(self._view[name::self.columns].tobytes())
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+    def arrays(self):
+        """
+        Returns all the samples as a NumPy array of samples x columns.
+        """
+        import numpy
+        return numpy.frombuffer(self._map, dtype="<f8", count=self.count * self.columns,
+                                offset=self._offset).reshape(self.count, self.columns)
+
+    def close(self):
+        if self._map:
+            self._view.release()
+            self._map.close()
+            self._fd.close()
+            self._map = None
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def to_csv(source, target, integers=()):
+    """
+    Write a recording out as CSV text, with a heading line.
+
+    Columns named in integers are written as ints.
+    """
+    with Recording(source) as recording, open(target, "w") as fd:
+        names = recording.names
+        print(", ".join(names), file=fd)
+        columns = [recording.column(i) for i in range(len(names))]
+        whole = [name in integers for name in names]
+        for row in zip(*columns):
+            print(", ".join(str(int(value)) if isint else str(value)
+                            for value, isint in zip(row, whole)), file=fd)
+    return
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+# Statistics stages for smoothing PWM readings
+
+import math
+from bisect import bisect_left, insort
+from collections import deque
+
+
+class WeightedStats:
+    """
+    The original exponential smoothing of readings.
+
+    The weighting is a number between 0 and 1 and indicates
+    how much the old reading affects the new reading.
+    It defaults to 0 which means the old reading has no effect.
+    Each new value is O(1) and the spread is tracked as an
+    exponentially weighted variance.
+    """
+
+    def __init__(self, weighting=0.0):
+        if weighting < 0.0:
+            weighting = 0.0
+        elif weighting > 0.99:
+            weighting = 0.99
+        self._new = 1.0 - weighting  # Weighting for new reading.
+        self._old = weighting  # Weighting for old reading.
+        self._value = None
+        self._variance = 0.0
+        self.count = 0
+        self.rejected = 0
+        return
+
+    def add(self, value):
+        """
+        Add a new reading.
+        """
+        self.count += 1
+        if self._value is None:
+            self._value = value
+        else:
+            diff = value - self._value
+            step = self._new * diff
+            self._value += step
+            self._variance = self._old * (self._variance + diff * step)
+        return
+
+    def value(self):
+        """
+        Returns the smoothed reading, or None if there is none yet.
+        """
+        return self._value
+
+    def minimum(self):
+        return self._value
+
+    def maximum(self):
+        return self._value
+
+    def median(self):
+        return self._value
+
+    def mean(self):
+        return self._value
+
+    def deviation(self):
+        """
+        Returns the standard deviation of the readings.
+        """
+        return math.sqrt(self._variance)
+
+
+class WindowStats:
+    """
+    Statistics over a sliding window of the most recent readings.
+
+    The window is kept both in arrival order (to know what to drop)
+    and sorted (for median, min/max and trimmed mean), so each new
+    reading costs a binary search plus running sums, not a rescan.
+
+    A reading further from the median than reject standard deviations
+    (or tolerance as a fraction of the median, whichever is bigger)
+    is treated as a glitch and left out.  If patience readings in a
+    row are rejected the signal has really moved, so the window is
+    started again from those readings.
+
+    estimate chooses what value() returns:
+    "median", "trimmed" (mean without the trim fraction at each end)
+    or "mean".
+    """
+
+    def __init__(self, size=16, trim=0.1, reject=3.0, tolerance=0.05,
+                 patience=3, estimate="median"):
+        self.size = max(size, 1)
+        self.trim = trim
+        self.reject = reject
+        self.tolerance = tolerance
+        self.patience = patience
+        self.estimate = estimate
+        self._window = deque()
+        self._sorted = []
+        self._sum = 0.0
+        self._squares = 0.0
+        self._misses = []  # rejected in a row
+        self.count = 0
+        self.rejected = 0
+        return
+
+    def _outlier(self, value):
+        if self.reject is None or len(self._window) < 3:
+            return False
+        median = self.median()
+        limit = max(self.reject * self.deviation(),
+                    self.tolerance * abs(median))
+        return abs(value - median) > limit
+
+    def add(self, value):
+        """
+        Add a new reading, unless it is rejected as an outlier.
+        """
+        self.count += 1
+        misses = self._misses
+        if self._outlier(value):
+            if len(misses) < self.patience:
+                misses.append(value)
+                self.rejected += 1
+                return
+            # the signal has moved, so drop the old level entirely
+            self._window.clear()
+            self._sorted = []
+            self._sum = 0.0
+            self._squares = 0.0
+            for miss in misses:
+                self._insert(miss)
+        self._misses = []
+        self._insert(value)
+        return
+
+    def _insert(self, value):
+        window = self._window
+        ordered = self._sorted
+        if len(window) >= self.size:
+            old = window.popleft()
+            del ordered[bisect_left(ordered, old)]
+            self._sum -= old
+            self._squares -= old * old
+        window.append(value)
+        insort(ordered, value)
+        self._sum += value
+        self._squares += value * value
+        return
+
+    def value(self):
+        """
+        Returns the chosen estimate, or None if there is none yet.
+        """
+        if not self._window:
+            return None
+        if self.estimate == "trimmed":
+            return self.trimmed()
+        if self.estimate == "mean":
+            return self.mean()
+        return self.median()
+
+    def minimum(self):
+        if not self._sorted:
+            return None
+        return self._sorted[0]
+
+    def maximum(self):
+        if not self._sorted:
+            return None
+        return self._sorted[-1]
+
+    def median(self):
+        ordered = self._sorted
+        n = len(ordered)
+        if n == 0:
+            return None
+        half = n // 2
+        if n % 2:
+            return ordered[half]
+        return (ordered[half - 1] + ordered[half]) / 2.0
+
+    def mean(self):
+        n = len(self._window)
+        if n == 0:
+            return None
+        return self._sum / n
+
+    def trimmed(self):
+        """
+        Returns the mean leaving out the trim fraction at each end.
+        """
+        ordered = self._sorted
+        n = len(ordered)
+        if n == 0:
+            return None
+        k = int(n * self.trim)
+        if k == 0 or 2 * k >= n:
+            return self._sum / n
+        total = self._sum - sum(ordered[:k]) - sum(ordered[-k:])
+        return total / (n - 2 * k)
+
+    def deviation(self):
+        """
+        Returns the standard deviation of the window.
+        """
+        n = len(self._window)
+        if n < 2:
+            return 0.0
+        mean = self._sum / n
+        variance = self._squares / n - mean * mean
+        if variance < 0.0:  # rounding
+            variance = 0.0
+        return math.sqrt(variance)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+# Decode multi-channel RC frames from a single input
+
+from array import array
+
+from TestCode.pigpiopool import pool
+from TestCode.testnppwm import FileStream
+from TestCode.Trace import trace
+import pigpio
+
+SBUS_SIZE = 25  # bytes in an SBUS frame
+SBUS_HEADER = 0x0F
+SBUS_FOOTER = 0x00
+SBUS_CHANNELS = 16
+SBUS_LOST = 0x04  # flag bit for a lost frame
+SBUS_FAILSAFE = 0x08  # flag bit for failsafe
+
+PPM_FRAME = trace.event("rc.ppm.frame", "timestamp", "errors")
+SBUS_FRAME = trace.event("rc.sbus.frame", "flags", "lost", "errors")
+
+
+class PpmDecoder:
+    """
+    Decode a PPM (pulse position) stream of rising edges.
+
+    Each channel is the time between one rising edge and the next.
+    A gap longer than sync microseconds ends the frame.
+    A finished frame is kept as frame, an array of pulse widths
+    in microseconds, with its timestamp (the tick of the sync).
+    Optionally when_frame(timestamp, frame) is called for each one.
+    """
+
+    def __init__(self, channels=8, sync=2700, when_frame=None):
+        self.channels = channels
+        self.sync = sync
+        self.when_frame = when_frame
+        self.frame = None  # last complete frame
+        self.timestamp = None  # tick at the start of it
+        self.frames = 0  # complete frames
+        self.errors = 0  # frames with the wrong number of channels
+        self._widths = array("H", bytes(2 * channels))
+        self._count = -1  # channels so far, -1 until the first sync
+        self._last = None  # tick of last rising edge
+        return
+
+    def edge(self, gpio, level, tick):
+        """
+        Handle an edge, suitable as a pigpio callback.
+        """
+        if level != 1:
+            return
+        last = self._last
+        self._last = tick
+        if last is None:
+            return
+        width = pigpio.tickDiff(last, tick)
+        if width >= self.sync:
+            if self._count == self.channels:
+                self.frame = array("H", self._widths)
+                self.timestamp = last
+                self.frames += 1
+                if trace.on:
+                    trace.record(PPM_FRAME, last, self.errors)
+                if self.when_frame:
+                    self.when_frame(last, self.frame)
+            elif self._count > 0:
+                self.errors += 1
+            self._count = 0
+        elif 0 <= self._count < self.channels:
+            self._widths[self._count] = width
+            self._count += 1
+        elif self._count >= self.channels:
+            self._count += 1  # too many, counted as an error at the sync
+        return
+
+
+class testppm:
+    """
+    A class to read all the channels of a PPM stream on one gpio.
+
+    Only rising edges are needed so there is one callback per
+    channel per frame, rather than two per channel per gpio.
+    """
+
+    def __init__(self, gpio, channels=8, sync=2700, pi=None, when_frame=None):
+        self.gpio = gpio
+        self.decoder = PpmDecoder(channels=channels, sync=sync,
+                                  when_frame=when_frame)
+        self._pooled = pi is None
+        if pi is None:
+            pi = pool.acquire()
+        self.pi = pi
+        pi.set_mode(gpio, pigpio.INPUT)
+        self._cb = pi.callback(gpio, pigpio.RISING_EDGE, self.decoder.edge)
+        return
+
+    def channels(self):
+        """
+        Returns the latest frame of pulse widths, or None.
+        """
+        return self.decoder.frame
+
+    def pulse_width(self, channel):
+        """
+        Returns the pulse width for a channel (counting from 0) in microseconds.
+        """
+        frame = self.decoder.frame
+        if frame is None:
+            return 0.0
+        return float(frame[channel])
+
+    def cancel(self):
+        """
+        Cancels the reader and releases resources.
+        """
+        self._cb.cancel()
+        if self._pooled:
+            pool.release(self.pi)
+        else:
+            self.pi.stop()
+        return
+
+
+def sbus2us(value):
+    """
+    Convert an SBUS channel value (172 to 1811) to microseconds (about 988 to 2012).
+    """
+    return ((value * 5) >> 3) + 880
+
+
+class SbusDecoder:
+    """
+    Decode SBUS style serial frames.
+
+    A frame is a header byte, 16 channels of 11 bits packed
+    little endian into 22 bytes, a flags byte and a footer byte.
+    Bytes may be fed in any sized pieces, decoding is done on
+    whole frames and it resyncs on the header if a frame is bad.
+    """
+
+    def __init__(self, when_frame=None):
+        self.when_frame = when_frame
+        self.frame = None  # last good frame, in microseconds
+        self.flags = 0
+        self.frames = 0
+        self.errors = 0
+        self.lost = 0  # frames marked as lost by the receiver
+        self._buffer = bytearray()
+        return
+
+    def feed(self, data, timestamp=None):
+        """
+        Add bytes, decoding any whole frames.  Returns the number of new frames.
+        """
+        buffer = self._buffer
+        buffer += data
+        found = 0
+        start = 0
+        end = len(buffer)
+        while end - start >= SBUS_SIZE:
+            if buffer[start] != SBUS_HEADER or \
+                    buffer[start + SBUS_SIZE - 1] != SBUS_FOOTER:
+                # out of step, look for the next header
+                header = buffer.find(SBUS_HEADER, start + 1)
+                self.errors += 1
+                if header < 0:
+                    start = end
+                    break
+                start = header
+                continue
+            bits = int.from_bytes(buffer[start + 1:start + 23], "little")
+            self.frame = array("H", [sbus2us((bits >> (11 * i)) & 0x7ff)
+                                     for i in range(SBUS_CHANNELS)])
+            self.flags = buffer[start + 23]
+            if self.flags & SBUS_LOST:
+                self.lost += 1
+            self.frames += 1
+            found += 1
+            if trace.on:
+                trace.record(SBUS_FRAME, self.flags, self.lost, self.errors)
+            if self.when_frame:
+                self.when_frame(timestamp, self.frame)
+            start += SBUS_SIZE
+        del buffer[:start]
+        return found
+
+    def failsafe(self):
+        return bool(self.flags & SBUS_FAILSAFE)
+
+
+def sbus_frame(values, flags=0):
+    """
+    Returns an SBUS frame (as bytes) for up to 16 channel values (172 to 1811).
+
+    Used to make stand-in streams for testing.
+    """
+    bits = 0
+    for i, value in enumerate(values[:SBUS_CHANNELS]):
+        bits |= (value & 0x7ff) << (11 * i)
+    return bytes([SBUS_HEADER]) + bits.to_bytes(22, "little") + \
+        bytes([flags, SBUS_FOOTER])
+
+
+class testsbus:
+    """
+    A class to read all the channels of an SBUS stream.
+
+    The source is a serial device, pty or file (as for FileStream)
+    and is read, in bulk, when the channels are asked for.
+    A real SBUS receiver needs the port set to 100000 baud, 8E2,
+    with the signal inverted, before it is given here.
+    """
+
+    def __init__(self, source, when_frame=None):
+        self.stream = FileStream(source)
+        self.decoder = SbusDecoder(when_frame=when_frame)
+        return
+
+    def update(self):
+        """
+        Decode whatever has arrived.  Returns the number of new frames.
+        """
+        data = self.stream.read()
+        if not data:
+            return 0
+        return self.decoder.feed(data)
+
+    def channels(self):
+        """
+        Returns the latest frame of pulse widths, or None.
+        """
+        self.update()
+        return self.decoder.frame
+
+    def pulse_width(self, channel):
+        """
+        Returns the pulse width for a channel (counting from 0) in microseconds.
+        """
+        frame = self.channels()
+        if frame is None:
+            return 0.0
+        return float(frame[channel])
+
+    def cancel(self):
+        """
+        Cancels the reader and releases resources.
+        """
+        self.stream.close()
+        return
@@ -27,7 +27,7 @@ class testgzpwm(reader):
     pulse high time per cycle.
     """
 
-    def __init__(self, gpio, weighting=0.0):
+    def __init__(self, gpio, weighting=0.0, capture=0, stats=None):
         """
         Optionally a weighting may be specified.  This is a number
         between 0 and 1 and indicates how much the old reading
@@ -35,36 +35,35 @@ class testgzpwm(reader):
         the old reading has no effect.  This may be used to
         smooth the data.
         """
-        super().__init__(gpio, weighting=weighting)
+        super().__init__(gpio, weighting=weighting, capture=capture, stats=stats)
         """
         Instantiate with the Pi and gpio of the PWM signal
         to monitor.
         """
         self.pin = DigitalInputDevice(pin=gpio)
 
-        self._high_time = None
-
-        self.pin.when_activated = self._up
-        self.pin.when_deactivated = self._down
+        if self._edges is not None:
+            self.pin.when_activated = self._capture_up
+            self.pin.when_deactivated = self._capture_down
+        else:
+            self.pin.when_activated = self._up
+            self.pin.when_deactivated = self._down
         return
 
     def _up(self):
-        if self._high_time is not None:
-            t = microseconds() - self._high_time
-            if self._period is not None:
-                self._period = (self._old * self._period) + (self._new * t)
-            else:
-                self._period = t
-        self._high_time = microseconds()
+        self._rising(microseconds())
         return
 
     def _down(self):
-        if self._high_time is not None:
-            t = microseconds() - self._high_time
-            if self._high is not None:
-                self._high = (self._old * self._high) + (self._new * t)
-            else:
-                self._high = t
+        self._falling(microseconds())
+        return
+
+    def _capture_up(self):
+        self._edges.append(1, microseconds())
+        return
+
+    def _capture_down(self):
+        self._edges.append(0, microseconds())
         return
 
     def cancel(self):
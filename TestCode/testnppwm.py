@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+# Read PWM values using the PiGPIO notification pipe
+
+import os
+import struct
+import sys
+from array import array
+from itertools import compress
+from operator import ne, not_
+
+from TestCode.testpwm import reader, LOST
+from TestCode.Trace import trace
+from TestCode.pigpiopool import pool
+import pigpio
+
+REPORT = struct.Struct("<HHII")  # seqno, flags, tick, level
+REPORT_SIZE = REPORT.size  # 12 bytes
+BLOCK = REPORT_SIZE * 512  # most bytes taken per read
+
+
+def reports(ticks, levels, seqno=0, flags=0):
+    """
+    Returns notification reports (as bytes) for the ticks and levels.
+
+    Used to make stand-in pipes and files for testing.
+    """
+    data = bytearray()
+    for tick, level in zip(ticks, levels):
+        data += REPORT.pack(seqno & 0xffff, flags, tick & 0xffffffff, level)
+        seqno += 1
+    return bytes(data)
+
+
+def decode(data):
+    """
+    Decode a block of whole reports into arrays.
+
+    Returns (seqnos, flags, ticks, levels) as arrays of unsigned ints.
+    The block is read as 16 bit halves (for seqno and flags) and as
+    32 bit words (for tick and level) and split by stride,
+    so there is no object (or unpack) per report.
+    """
+    halves = array("H")
+    halves.frombytes(data)
+    words = array("I")
+    words.frombytes(data)
+    if sys.byteorder != "little":
+        halves.byteswap()
+        words.byteswap()
+    return halves[0::6], halves[1::6], words[1::3], words[2::3]
+
+
+class FileStream:
+    """
+    Reads raw report bytes, without blocking, from a file or pipe.
+
+    This is the stand-in for the pigpio pipe when testing,
+    and the basis of NotifyStream.
+    """
+
+    def __init__(self, source):
+        if isinstance(source, int):
+            self.fd = source
+        else:
+            self.fd = os.open(source, os.O_RDONLY | os.O_NONBLOCK)
+        os.set_blocking(self.fd, False)
+        return
+
+    def read(self):
+        """
+        Returns all the bytes available now (maybe none).
+        """
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(self.fd, BLOCK)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        return
+
+
+class NotifyStream(FileStream):
+    """
+    Reads the reports for some gpios from a pigpio notification pipe.
+
+    The pipe is /dev/pigpioN on the Pi running the daemon,
+    so this only works on that Pi.
+    """
+
+    def __init__(self, gpios, pi=None):
+        self._pooled = pi is None
+        if pi is None:
+            pi = pool.acquire()
+        self.pi = pi
+        self.handle = pi.notify_open()
+        super().__init__(f"/dev/pigpio{self.handle}")
+        bits = 0
+        for gpio in gpios:
+            pi.set_mode(gpio, pigpio.INPUT)
+            bits |= 1 << gpio
+        pi.notify_begin(self.handle, bits)
+        return
+
+    def close(self):
+        if self.handle is not None:
+            self.pi.notify_close(self.handle)
+            self.handle = None
+            super().close()
+            if self._pooled:
+                pool.release(self.pi)
+        return
+
+
+class testnppwm(reader):
+    """
+    A class to read PWM pulses and calculate their frequency
+    and duty cycle.  The frequency is how often the pulse
+    happens per second.  The duty cycle is the percentage of
+    pulse high time per cycle.
+
+    There are no callbacks, the edges are streamed by the daemon
+    into a pipe and only read, a block at a time, when a reading
+    is asked for.
+    """
+
+    def __init__(self, gpio, weighting=0.0, pi=None, stream=None, stats=None):
+        """
+        Optionally a weighting may be specified.  This is a number
+        between 0 and 1 and indicates how much the old reading
+        affects the new reading.  It defaults to 0 which means
+        the old reading has no effect.  This may be used to
+        smooth the data.
+
+        Optionally a stream (such as a FileStream) may be given
+        instead of opening a notification pipe on the Pi.
+        """
+        super().__init__(gpio, weighting=weighting, stats=stats)
+        if stream is None:
+            stream = NotifyStream([gpio], pi=pi)
+        self.stream = stream
+
+        self._partial = b""  # part of a report left from the last read
+        self._level = None  # last level seen for the gpio
+        self._seqno = None  # next report number expected
+        return
+
+    def _diff(self, earlier, later):
+        return pigpio.tickDiff(earlier, later)
+
+    def _collect(self):
+        """
+        Fold any streamed reports into the readings.
+        """
+        data = self._partial + self.stream.read()
+        whole = len(data) - len(data) % REPORT_SIZE
+        self._partial = data[whole:]
+        if whole == 0:
+            return
+        seqnos, flags, ticks, levels = decode(data[:whole])
+
+        # count reports the daemon dropped
+        if self._seqno is not None:
+            missing = (seqnos[0] - self._seqno) & 0xffff
+            missing += (seqnos[-1] - seqnos[0] - len(seqnos) + 1) & 0xffff
+            if missing:
+                self.lost += missing
+                if trace.on:
+                    trace.record(LOST, self.gpio, missing)
+                self._rise = None  # can't pair across the gap
+        self._seqno = (seqnos[-1] + 1) & 0xffff
+
+        if any(flags):  # watchdogs or keep alives, not edges
+            keep = list(map(not_, flags))
+            ticks = array("I", compress(ticks, keep))
+            levels = array("I", compress(levels, keep))
+            if not ticks:
+                return
+
+        # the gpio's level in each report, and where it changes
+        gpio = self.gpio
+        bits = array("b", [(level >> gpio) & 1 for level in levels])
+        last = self._level
+        if last is None:
+            last = bits[0]
+        self._level = bits[-1]
+        changed = list(map(ne, bits, array("b", [last]) + bits[:-1]))
+        levels = array("b", compress(bits, changed))
+        ticks = array("I", compress(ticks, changed))
+        if not levels:
+            return
+        if self.when_pulse or trace.on or not self._pair(levels, ticks):
+            self._replay(levels, ticks)
+        return
+
+    def cancel(self):
+        """
+        Cancels the reader and releases resources.
+        """
+        super().cancel()
+        self.stream.close()
+        return
@@ -3,6 +3,7 @@
 # Read PWM values using PiGPIO
 
 from TestCode.testpwm import reader
+from TestCode.pigpiopool import pool
 import pigpio
 
 
@@ -14,7 +15,7 @@ class testpgpwm(reader):
     pulse high time per cycle.
     """
 
-    def __init__(self, gpio, weighting=0.0, pi=None):
+    def __init__(self, gpio, weighting=0.0, pi=None, capture=0, stats=None):
         """
         Optionally a weighting may be specified.  This is a number
         between 0 and 1 and indicates how much the old reading
@@ -22,37 +23,36 @@ class testpgpwm(reader):
         the old reading has no effect.  This may be used to
         smooth the data.
         """
-        super().__init__(gpio, weighting=weighting)
+        super().__init__(gpio, weighting=weighting, capture=capture, stats=stats)
         """
         Instantiate with the Pi and gpio of the PWM signal
         to monitor.
+        If no Pi is given a shared one is taken from the pool.
         """
+        self._pooled = pi is None
         if pi is None:
-            pi = pigpio.pi()
+            pi = pool.acquire()
         self.pi = pi
 
-        self._high_tick = None
-
         pi.set_mode(gpio, pigpio.INPUT)
-        self._cb = pi.callback(gpio, pigpio.EITHER_EDGE, self._cbf)
+        callback = self._cbf
+        if self._edges is not None:
+            callback = self._capture
+        self._cb = pi.callback(gpio, pigpio.EITHER_EDGE, callback)
         return
 
+    def _diff(self, earlier, later):
+        return pigpio.tickDiff(earlier, later)
+
     def _cbf(self, gpio, level, tick):
         if level == 1:
-            if self._high_tick is not None:
-                t = pigpio.tickDiff(self._high_tick, tick)
-                if self._period is not None:
-                    self._period = (self._old * self._period) + (self._new * t)
-                else:
-                    self._period = t
-            self._high_tick = tick
+            self._rising(tick)
         elif level == 0:
-            if self._high_tick is not None:
-                t = pigpio.tickDiff(self._high_tick, tick)
-                if self._high is not None:
-                    self._high = (self._old * self._high) + (self._new * t)
-                else:
-                    self._high = t
+            self._falling(tick)
+        return
+
+    def _capture(self, gpio, level, tick):
+        self._edges.append(level, tick)
         return
 
     def cancel(self):
@@ -61,6 +61,77 @@ class testpgpwm(reader):
         """
         super().cancel()
         self._cb.cancel()
-        self.pi.stop()
+        if self._pooled:
+            pool.release(self.pi)
+        else:
+            self.pi.stop()
+        return
+
+
+class pgchannel(reader):
+    """
+    One channel of a multipgpwm, fed by its callback.
+    """
+
+    def _diff(self, earlier, later):
+        return pigpio.tickDiff(earlier, later)
+
+
+class multipgpwm:
+    """
+    A class to read PWM pulses on several gpios over one
+    (shared) Pi connection.  Every gpio uses the same callback,
+    which passes the edge on to that gpio's channel.
+    Channels are readers, so have frequency(), pulse_width()
+    and duty_cycle().
+    """
+
+    def __init__(self, gpios, weighting=0.0, pi=None, capture=0, stats=None):
+        """
+        Instantiate with the gpios of the PWM signals to monitor.
+        The other options are as for testpgpwm and apply to every channel.
+        """
+        self._pooled = pi is None
+        if pi is None:
+            pi = pool.acquire()
+        self.pi = pi
+
+        self.channels = {}
+        for gpio in gpios:
+            self.channels[gpio] = pgchannel(
+                gpio, weighting=weighting, capture=capture, stats=stats)
+        self._capturing = capture > 0
+        self._cbs = []
+        for gpio in gpios:
+            pi.set_mode(gpio, pigpio.INPUT)
+            self._cbs.append(pi.callback(gpio, pigpio.EITHER_EDGE, self._cbf))
+        return
+
+    def __getitem__(self, gpio):
+        return self.channels[gpio]
+
+    def _cbf(self, gpio, level, tick):
+        channel = self.channels[gpio]
+        if self._capturing:
+            channel._edges.append(level, tick)
+        elif level == 1:
+            channel._rising(tick)
+        elif level == 0:
+            channel._falling(tick)
+        return
+
+    def cancel(self):
+        """
+        Cancels the reader and releases resources.
+        """
+        for cb in self._cbs:
+            cb.cancel()
+        self._cbs = []
+        for channel in self.channels.values():
+            channel.cancel()
+        if self._pooled:
+            pool.release(self.pi)
+        else:
+            self.pi.stop()
         return
 
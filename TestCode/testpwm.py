@@ -3,6 +3,141 @@
 # Read PWM values using PiGPIO
 
 import time
+from array import array
+from collections import deque, namedtuple
+from threading import Condition
+
+from TestCode.pwmstats import WeightedStats
+from TestCode.pwmrecord import Recorder, to_csv
+from TestCode.Trace import trace
+
+PULSE = trace.event("reader.pulse", "gpio", "width")
+LOST = trace.event("reader.lost", "gpio", "edges")
+
+
+class EdgeBuffer:
+    """
+    A preallocated, array backed ring buffer of raw edges.
+
+    Callbacks only append the level and time of each edge,
+    which is all the work done on the callback thread.
+    Readers ask for everything since the last count they saw
+    and get back array slices to process in one batch.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.levels = array('b', bytes(size))
+        self.times = array('d', bytes(8 * size))
+        self.count = 0  # total edges ever appended
+        return
+
+    def append(self, level, time):
+        """
+        Record an edge, overwriting the oldest once full.
+        """
+        i = self.count % self.size
+        self.levels[i] = level
+        self.times[i] = time
+        self.count += 1
+        return
+
+    def since(self, seen):
+        """
+        Returns (levels, times, count, lost) for edges after seen.
+
+        count is the new total to pass next time and lost
+        is how many edges were overwritten before being read.
+        """
+        count = self.count
+        start = max(seen, count - self.size)
+        lost = start - seen
+        first = start % self.size
+        last = first + count - start
+        if last <= self.size:
+            levels = self.levels[first:last]
+            times = self.times[first:last]
+        else:
+            last -= self.size
+            levels = self.levels[first:] + self.levels[:last]
+            times = self.times[first:] + self.times[:last]
+        return levels, times, count, lost
+
+
+Change = namedtuple("Change", "time gpio pulse_width frequency duty_cycle")
+
+
+class ChangeStream:
+    """
+    A stream of Change notifications from watched readers.
+
+    Readers publish (from their callbacks) when their pulse width
+    moves by more than their threshold, so get() only wakes up
+    when something has happened.
+    If poll is given (in seconds) watched readers are also checked
+    that often while waiting, which is the fallback for readers
+    without callbacks (capture mode or streamed).
+    At most size changes are kept, the oldest are dropped.
+    Changes are numbered from 1 as they are put, and taken is
+    the number of the one get() last returned, so a gap in taken
+    is changes that were dropped.
+    """
+
+    def __init__(self, poll=None, size=1024):
+        self.poll = poll
+        self.readers = []
+        self.dropped = 0
+        self.count = 0  # changes ever put
+        self.taken = 0  # number of the change last returned
+        self._changes = deque()
+        self._size = size
+        self._ready = Condition()
+        return
+
+    def add(self, reader):
+        with self._ready:
+            self.readers.append(reader)
+        return
+
+    def remove(self, reader):
+        with self._ready:
+            if reader in self.readers:
+                self.readers.remove(reader)
+        return
+
+    def put(self, change):
+        with self._ready:
+            if len(self._changes) >= self._size:
+                self._changes.popleft()
+                self.dropped += 1
+            self._changes.append(change)
+            self.count += 1
+            self._ready.notify()
+        return
+
+    def get(self, timeout=None):
+        """
+        Returns the next Change, waiting for one if needed.
+        Returns None if there is none within timeout seconds.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        with self._ready:
+            while not self._changes:
+                wait = self.poll
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    if wait is None or remaining < wait:
+                        wait = remaining
+                if not self._ready.wait(wait) and self.poll:
+                    for reader in self.readers:
+                        reader.check()
+            change = self._changes.popleft()
+            self.taken = self.count - len(self._changes)
+            return change
 
 
 class reader:
@@ -13,7 +148,7 @@ class reader:
     pulse high time per cycle.
     """
 
-    def __init__(self, gpio, weighting=0.0):
+    def __init__(self, gpio, weighting=0.0, capture=0, stats=None):
         """
         Common set up.
 
@@ -22,93 +157,313 @@ class reader:
         affects the new reading.  It defaults to 0 which means
         the old reading has no effect.  This may be used to
         smooth the data.
+
+        Optionally capture may be given as a number of edges.
+        If so the callbacks just record raw edges in an EdgeBuffer
+        of that size and the readings are only worked out
+        (in one batch) when they are asked for.
+
+        Optionally stats may be given to choose how readings are
+        smoothed.  It is called (with no arguments) to make a
+        statistics stage for the period and another for the pulse
+        width, such as pwmstats.WindowStats.  It defaults to a
+        WeightedStats using the weighting.
+
+        Optionally when_pulse may be set to a function taking
+        (gpio, width) to be called, on the callback thread, at the
+        end of each pulse (not in capture mode).
         """
         self.gpio = gpio
-        if weighting < 0.0:
-            weighting = 0.0
-        elif weighting > 0.99:
-            weighting = 0.99
-        self._new = 1.0 - weighting  # Weighting for new reading.
-        self._old = weighting  # Weighting for old reading.
+        if stats is None:
+            def stats():
+                return WeightedStats(weighting)
+
+        self._period = stats()  # time between change to high in microseconds
+        self._high = stats()  # time between change to high and change to low in microseconds
+        self._rise = None  # time of the last change to high
+
+        self._edges = None
+        self._seen = 0  # edges already taken from the buffer
+        self.lost = 0  # edges overwritten before they were read
+        self.when_pulse = None
+        self._stream = None  # ChangeStream being published to
+        self._threshold = 0.0
+        self._published = None  # pulse width last published
+        if capture > 0:
+            self._edges = EdgeBuffer(capture)
+        return
+
+    def _diff(self, earlier, later):
+        """
+        Returns the time in microseconds between two edge times.
+        """
+        return later - earlier
+
+    def _rising(self, time):
+        """
+        Handle a change to high.
+        """
+        if self._rise is not None:
+            self._period.add(self._diff(self._rise, time))
+        self._rise = time
+        return
+
+    def _falling(self, time):
+        """
+        Handle a change to low.
+        """
+        if self._rise is not None:
+            t = self._diff(self._rise, time)
+            self._high.add(t)
+            if trace.on:
+                trace.record(PULSE, self.gpio, t)
+            if self.when_pulse:
+                self.when_pulse(self.gpio, t)
+            if self._stream is not None:
+                self._publish()
+        return
+
+    def watch(self, stream, threshold=5.0):
+        """
+        Publish a Change to stream whenever the pulse width moves
+        more than threshold microseconds from the last one published.
+        """
+        self._threshold = threshold
+        self._published = None
+        self._stream = stream
+        stream.add(self)
+        return
+
+    def unwatch(self):
+        if self._stream is not None:
+            self._stream.remove(self)
+            self._stream = None
+        return
+
+    def check(self):
+        """
+        Bring the readings up to date and publish any change.
+        """
+        self._collect()
+        if self._stream is not None:
+            self._publish()
+        return
+
+    def _publish(self):
+        width = self._high.value()
+        if width is None:
+            return
+        last = self._published
+        if last is not None and abs(width - last) <= self._threshold:
+            return
+        self._published = width
+        period = self._period.value()
+        frequency = duty = 0.0
+        if period:
+            frequency = 1000000.0 / period
+            duty = 100.0 * width / period
+        self._stream.put(Change(time.time(), self.gpio, width, frequency, duty))
+        return
 
-        self._period = None  # time between change to high in microseconds
-        self._high = None  # time between change to high and change to low in microseconds
+    def _collect(self):
+        """
+        Fold any captured edges into the readings.
+        """
+        if self._edges is None:
+            return
+        levels, times, self._seen, lost = self._edges.since(self._seen)
+        if lost:
+            self.lost += lost
+            if trace.on:
+                trace.record(LOST, self.gpio, lost)
+            self._rise = None  # can't pair across the gap
+        if not levels:
+            return
+        if self.when_pulse or trace.on or not self._pair(levels, times):
+            self._replay(levels, times)
+        return
 
+    def _replay(self, levels, times):
+        """
+        Fold edges in one at a time, for per pulse hooks or
+        when the levels don't simply alternate.
+        """
+        rising = self._rising
+        falling = self._falling
+        for level, time in zip(levels, times):
+            if level == 1:
+                rising(time)
+            elif level == 0:
+                falling(time)
         return
 
+    def _pair(self, levels, times):
+        """
+        Fold alternating edges in by slicing the buffer.
+
+        Rises are every other edge from the first rise and falls
+        the ones in between, so the widths and periods come from
+        mapping _diff over slices with no Python loop per edge.
+        Returns False (having done nothing) if the levels don't
+        alternate, to fall back to _replay().
+        """
+        n = len(levels)
+        start = levels.index(1) if 1 in levels else n
+        if start > 1 or (start == 1 and levels[0] != 0):
+            return False
+        rises = times[start::2]
+        if levels[start::2].count(1) != len(rises):
+            return False
+        falls = times[start + 1::2]
+        if levels[start + 1::2].count(0) != len(falls):
+            return False
+
+        diff = self._diff
+        high = self._high
+        period = self._period
+        if start == 1 and self._rise is not None:
+            high.add(diff(self._rise, times[0]))
+        if rises:
+            if self._rise is not None:
+                period.add(diff(self._rise, rises[0]))
+            # each width still passes through the statistics stage
+            deque(map(period.add, map(diff, rises, rises[1:])), maxlen=0)
+            deque(map(high.add, map(diff, rises, falls)), maxlen=0)
+            self._rise = rises[-1]
+        if self._stream is not None:
+            self._publish()
+        return True
+
     def frequency(self):
         """
         Returns the PWM frequency.
         """
+        self._collect()
         value = 0.0
-        if self._period is not None:
-            value = 1000000.0 / self._period
+        period = self._period.value()
+        if period:
+            value = 1000000.0 / period
         return value
 
     def pulse_width(self):
         """
         Returns the PWM pulse width in microseconds.
         """
+        self._collect()
         value = 0.0
-        if self._high is not None:
-            value = self._high
+        high = self._high.value()
+        if high is not None:
+            value = high
         return value
 
     def duty_cycle(self):
         """
         Returns the PWM duty cycle percentage.
         """
+        self._collect()
         value = 0.0
-        if self._high is not None:
-            value = 100.0 * self._high / self._period
+        high = self._high.value()
+        period = self._period.value()
+        if high is not None and period:
+            value = 100.0 * high / period
         return value
 
+    def jitter(self):
+        """
+        Returns the standard deviation of the pulse width in microseconds.
+        """
+        self._collect()
+        return self._high.deviation()
+
+    def statistics(self):
+        """
+        Returns the pulse width statistics as a dictionary of
+        median, mean, minimum, maximum, deviation and rejected count.
+        """
+        self._collect()
+        high = self._high
+        return {
+            "median": high.median(),
+            "mean": high.mean(),
+            "minimum": high.minimum(),
+            "maximum": high.maximum(),
+            "deviation": high.deviation(),
+            "rejected": high.rejected,
+        }
+
     def cancel(self):
         """
         Cancels the reader and releases resources.
         """
+        self.unwatch()
         return
 
 
 RUN_TIME = 60.0
 SAMPLE_TIME = 0.5
+WATCH_THRESHOLD = 5.0  # microseconds change that counts as a change
+COLUMNS = ("time", "rf", "rpw", "rdc", "mf", "mpw", "mdc", "seq")
 
 
-def testpwm(name, reader):
+def testpwm(name, reader, csv=True, poll=False, **options):
+    """
+    Sample a rudder and motor reader for RUN_TIME.
+
+    A sample is taken whenever either reader reports a change
+    (of more than WATCH_THRESHOLD), or if poll, every SAMPLE_TIME.
+    Each sample records seq, the number of the change it was taken
+    for, or if poll, the number of the SAMPLE_TIME slot it was taken
+    in, so gaps in seq are changes or slots that were missed.
+    Samples are streamed to name + '.pwm' (see pwmrecord) as they
+    are taken and, if csv, written out as name + '.txt' at the end.
+    """
 
     rudder_GPIO = 4  # connected to 13 (driven by test harness)
     motor_GPIO = 5  # connected to 18 (driven by test harness)
 
-    rp = reader(rudder_GPIO)
-    mp = reader(motor_GPIO)
+    # options (such as capture=256) are passed on to the readers
+    rp = reader(rudder_GPIO, **options)
+    mp = reader(motor_GPIO, **options)
+
+    stream = None
+    if not poll:
+        # SAMPLE_TIME is only used to check readers without callbacks
+        stream = ChangeStream(poll=SAMPLE_TIME)
+        rp.watch(stream, WATCH_THRESHOLD)
+        mp.watch(stream, WATCH_THRESHOLD)
 
-    recordings = []
+    recorder = Recorder(name + '.pwm', COLUMNS)
     input(f"Waiting to start test: {name} - press enter")  # don't care what is typed before enter
     start = time.time()
     now = start
-    print(f"RUN_TIME = {RUN_TIME}, SAMPLE_TIME = {SAMPLE_TIME}")
+    print(f"RUN_TIME = {RUN_TIME}, SAMPLE_TIME = {SAMPLE_TIME}, poll = {poll}")
     print(f"Starting test {name}: time = {now}")
+    seq = 0
     while (now - start) < RUN_TIME:
-        time.sleep(SAMPLE_TIME)
+        if stream:
+            stream.get(timeout=RUN_TIME - (now - start))
+            seq = stream.taken
+        else:
+            seq += 1
+            time.sleep(max(0.0, start + seq * SAMPLE_TIME - time.time()))
         now = time.time()
+        if not stream:
+            seq = max(seq, int((now - start) / SAMPLE_TIME))  # slots missed if late
         rf = rp.frequency()
         mf = mp.frequency()
         rpw = int(rp.pulse_width() + 0.5)  # round to nearest int
         mpw = int(mp.pulse_width() + 0.5)  # round to nearest int
         rdc = rp.duty_cycle()
         mdc = mp.duty_cycle()
-        recordings.append((now, rf, rpw, rdc, mf, mpw, mdc))
+        recorder.write(now, rf, rpw, rdc, mf, mpw, mdc, seq)
 
     rp.cancel()
     mp.cancel()
+    recorder.close()
     print(f"Finished test {name}: time = {now}. took {now-start}")
 
-    with open(name + '.txt', 'w') as fd:
-        # print("time, rf, rpw, rdc, mf, mpw, mdc")
-        print("time, rf, rpw, rdc, mf, mpw, mdc", file=fd)
-        for now, rf, rpw, rdc, mf, mpw, mdc in recordings:
-            # print(f"{now}, {rf}, {rpw}, {rdc}, {mf}, {mpw}, {mdc}")
-            print(f"{now}, {rf}, {rpw}, {rdc}, {mf}, {mpw}, {mdc}", file=fd)
+    if csv:
+        to_csv(name + '.pwm', name + '.txt', integers=("rpw", "mpw", "seq"))
 
     print(f"{name}: All done")
 
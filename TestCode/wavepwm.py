@@ -5,26 +5,89 @@ Created on 23 Jul 2021
 '''
 
 from threading import Thread
+from array import array
 import time, math
 from gpiozero import PWMLED
 
-class WavePWM(Thread):
-    '''
-    classdocs
+'''
+Waveforms are functions of (t, duration) returning -1 to +1,
+where t is the seconds into a playlist entry lasting duration.
+'''
+
+def sine(period=30.0, phase=0.0):
+    def wave(t, duration):
+        return math.sin(2 * math.pi * t / period + phase)
+    return wave
+
+def cosine(period=30.0):
+    return sine(period, math.pi / 2)
+
+def square(period=1.0, duty=0.5, low=-1.0, high=1.0):
+    def wave(t, duration):
+        return high if (t % period) < duty * period else low
+    return wave
+
+def ramp(start=-1.0, end=1.0):
+    def wave(t, duration):
+        return start + (end - start) * t / duration
+    return wave
+
+def step(*levels):
+    # hold each level for an equal share of the duration
+    def wave(t, duration):
+        i = int(len(levels) * t / duration)
+        return levels[min(i, len(levels) - 1)]
+    return wave
+
+def chirp(start=0.1, end=5.0):
+    # sine sweeping from start to end Hz over the duration
+    def wave(t, duration):
+        return math.sin(2 * math.pi * (start * t + (end - start) * t * t / (2 * duration)))
+    return wave
+
+def trace(values, rate):
+    # recorded values taken rate times a second, held between samples
+    def wave(t, duration):
+        i = int(t * rate)
+        return values[min(i, len(values) - 1)]
+    return wave
+
+def constant(value=0.0):
+    def wave(t, duration):
+        return value
+    return wave
+
+
+class WaveGenerator(Thread):
     '''
+    Plays a playlist of waveforms as PWM on any number of pins.
 
+    The playlist is a list of (duration, (wave, wave, ...)) with
+    one wave per pin.  The whole playlist is turned into a table
+    of PWM values per pin at rate updates a second before starting,
+    so each update is just a lookup.
+    Updates are due at fixed times from the start on the monotonic
+    clock, so there is no drift.  If an update is late by a whole
+    update or more, the missed ones are skipped (and counted in
+    missed) to get back in time.
+    '''
 
-    def __init__(self, rudder, motor):
-        '''
-        Constructor
-        '''
+    def __init__(self, pins, playlist, rate=10.0, repeat=True, frequency=100):
         super().__init__()
-        self.rudder = PWMLED(pin=rudder, initial_value=0, frequency=100)
-        self.motor = PWMLED(pin=motor, initial_value=0, frequency=100)
+        self.devices = [PWMLED(pin=pin, initial_value=0, frequency=frequency)
+                        for pin in pins]
         self.max = .75
         self.min = .25
         self.mid = (self.max + self.min) / 2
         self.range = self.max - self.min
+        self.rate = rate
+        self.repeat = repeat
+        self.tables = self.makeTables(playlist)
+        self.length = len(self.tables[0]) if self.tables else 0
+        self.updates = 0  # updates written
+        self.missed = 0  # updates skipped as too late
+        self.late = 0.0  # worst lateness (seconds) of an update written
+        self.ok = False
         return
 
     def toPWM(self, value):
@@ -35,21 +98,69 @@ class WavePWM(Thread):
         offset = self.mid
         return offset + size
 
+    def makeTables(self, playlist):
+        # one array of pwm values per pin, for the whole playlist
+        tables = [array('d') for device in self.devices]
+        for entry, (duration, waves) in enumerate(playlist):
+            if len(waves) != len(self.devices):
+                raise ValueError(f"playlist entry {entry} has {len(waves)} waves "
+                                 f"for {len(self.devices)} pins")
+            steps = int(round(duration * self.rate))
+            for table, wave in zip(tables, waves):
+                table.extend(self.toPWM(wave(i / self.rate, duration))
+                             for i in range(steps))
+        return tables
+
+    def stop(self):
+        self.ok = False
+        return
+
     def run(self):
         self.ok = True
-        base = time.time()
-        while self.ok:
-            theta = (time.time() - base) / 30 # as a fraction of half a minute
-            theta *= math.pi * 2
-            cos = math.cos(theta)
-            sin = math.sin(theta)
-            self.rudder.value = self.toPWM(cos)
-            self.motor.value = self.toPWM(sin)
-            time.sleep(0.1) # try to make it fairly smooth
+        interval = 1.0 / self.rate
+        start = time.monotonic()
+        tick = 0
+        last = [None] * len(self.devices)
+        while self.ok and self.length:
+            if tick >= self.length and not self.repeat:
+                break
+            due = start + tick * interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                behind = int(-delay / interval)
+                if behind:  # skip what can no longer be on time
+                    self.missed += behind
+                    tick += behind
+                    continue
+                if -delay > self.late:
+                    self.late = -delay
+            index = tick % self.length
+            for i, device in enumerate(self.devices):
+                value = self.tables[i][index]
+                if value != last[i]:
+                    device.value = value
+                    last[i] = value
+            self.updates += 1
+            tick += 1
+        return
+
+
+class WavePWM(WaveGenerator):
+    '''
+    The original test signal: a 30 second cosine on the rudder
+    and sine on the motor, updated 10 times a second.
+    '''
+
+    def __init__(self, rudder, motor):
+        '''
+        Constructor
+        '''
+        super().__init__((rudder, motor), [(30.0, (cosine(30.0), sine(30.0)))], rate=10.0)
         return
 
 if __name__ == "__main__":
     signal = WavePWM(13, 18) # send on pins 13, and 18
     signal.start()
     signal.join() # wait till ends - basically forever
-
@@ -19,3 +19,6 @@ if __name__ == "__main__":
     testpwm("gpiozero-test", gpiozeroreader)
 
     print("All tests complete")
+
+    from TestCode.pwmanalysis import report
+    print(report(("pigpio-test", "gpiozero-test")))